@@ -187,10 +187,132 @@ GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 GROQ_MODEL = "llama-3.3-70b-versatile"
 
 KNOWLEDGE_BASE_PATH = "app/data/support_topics.csv"
+# The API polls the knowledge base file and applies changed rows in place; 0 disables hot reload
+KB_WATCH_INTERVAL_SECONDS = float(os.getenv("KB_WATCH_INTERVAL_SECONDS", "5"))
+# Vector index backend: "memory" (per process), "path" (embedded, persisted to QDRANT_PATH,
+# single process only) or "server" (QDRANT_URL, over gRPC when QDRANT_PREFER_GRPC is set).
+# Persistent backends keep vectors whose id and content hash still match, so restarts skip embedding.
+QDRANT_MODE = os.getenv("QDRANT_MODE", "memory")
+QDRANT_PATH = os.getenv("QDRANT_PATH", "app/data/qdrant_local")
+QDRANT_URL = os.getenv("QDRANT_URL") or "http://localhost:6333"
+QDRANT_API_KEY = os.getenv("QDRANT_API_KEY") or None
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "true").lower() == "true"
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+QDRANT_COLLECTION = os.getenv("QDRANT_COLLECTION", "conversations")
+# Shared secret for the /admin/knowledge-base endpoints (X-Admin-Key header); unset disables them
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY")
 EMBEDDING_MODEL = "BAAI/bge-base-en-v1.5"
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "app/data/embedding_cache")
+# ONNX intra-op threads for the embedder; 0 lets onnxruntime pick
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+# Worker threads that run embedding and vector search off the event loop
+EMBEDDING_POOL_SIZE = int(os.getenv("EMBEDDING_POOL_SIZE", "4"))
+# Micro-batching of concurrent query embeddings
+EMBEDDING_BATCH_MAX_SIZE = int(os.getenv("EMBEDDING_BATCH_MAX_SIZE", "32"))
+EMBEDDING_BATCH_MAX_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_MAX_WAIT_MS", "5"))
+
+# Classification result cache; a semantic threshold of 0 disables the near-duplicate tier
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "10000"))
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", "86400"))
+RESULT_CACHE_SEMANTIC_THRESHOLD = float(os.getenv("RESULT_CACHE_SEMANTIC_THRESHOLD", "0"))
+
+# Embedding-only kNN classifier over the labelled KB; answers without the LLM when the
+# nearest neighbour is at least FAST_PATH_MIN_SIMILARITY (cosine) and at least
+# FAST_PATH_MIN_AGREEMENT of the similarity-weighted top-k vote agrees. 0 disables it.
+FAST_PATH_MIN_SIMILARITY = float(os.getenv("FAST_PATH_MIN_SIMILARITY", "0"))
+FAST_PATH_MIN_AGREEMENT = float(os.getenv("FAST_PATH_MIN_AGREEMENT", "0.8"))
+FAST_PATH_TOP_K = int(os.getenv("FAST_PATH_TOP_K", "5"))
+
+# Few-shot context: up to CONTEXT_TOP_K labelled neighbours packed into CONTEXT_TOKEN_BUDGET
+# (estimated) tokens; neighbours at or above CONTEXT_DEDUPE_SIMILARITY to a kept one are dropped
+CONTEXT_TOP_K = int(os.getenv("CONTEXT_TOP_K", "5"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "600"))
+CONTEXT_DEDUPE_SIMILARITY = float(os.getenv("CONTEXT_DEDUPE_SIMILARITY", "0.97"))
+
+# Invalid LLM labels are snapped to the closest valid path when its similarity score
+# (0-1, specificity-weighted mean over the three labels) reaches this threshold; 0 always falls back to repair
+LABEL_RESOLVER_MIN_SCORE = float(os.getenv("LABEL_RESOLVER_MIN_SCORE", "0.8"))
+
+# Batch classification
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+
+# Streaming bulk classification
+STREAM_MAX_IN_FLIGHT = int(os.getenv("STREAM_MAX_IN_FLIGHT", "16"))
+STREAM_MAX_RECORD_BYTES = int(os.getenv("STREAM_MAX_RECORD_BYTES", str(1024 * 1024)))
+
+def _provider_map(env_name: str, cast=float) -> dict:
+    # Parses per-provider settings such as "hugging_face=60,gemini=15"
+    return {
+        name.strip(): cast(value)
+        for name, value in (
+            entry.split("=") for entry in os.getenv(env_name, "").split(",") if entry.strip()
+        )
+    }
+
+# Per-provider request quotas; unset providers are unlimited
+PROVIDER_REQUESTS_PER_MINUTE = _provider_map("PROVIDER_REQUESTS_PER_MINUTE")
+
+# AIMD concurrency limits per provider: grow by one slot per window of healthy calls,
+# shrink multiplicatively on 429/5xx or when latency exceeds the target
+PROVIDER_INITIAL_CONCURRENCY = int(os.getenv("PROVIDER_INITIAL_CONCURRENCY", "4"))
+PROVIDER_MIN_CONCURRENCY = int(os.getenv("PROVIDER_MIN_CONCURRENCY", "1"))
+PROVIDER_MAX_CONCURRENCY = _provider_map("PROVIDER_MAX_CONCURRENCY", int)
+PROVIDER_DEFAULT_MAX_CONCURRENCY = int(os.getenv("PROVIDER_DEFAULT_MAX_CONCURRENCY", "32"))
+CONCURRENCY_BACKOFF_FACTOR = float(os.getenv("CONCURRENCY_BACKOFF_FACTOR", "0.5"))
+CONCURRENCY_LATENCY_TARGET_SECONDS = float(os.getenv("CONCURRENCY_LATENCY_TARGET_SECONDS", "8"))
+# Cool-down applied after a 429 that carries no Retry-After header
+CONCURRENCY_DEFAULT_RETRY_AFTER_SECONDS = float(os.getenv("CONCURRENCY_DEFAULT_RETRY_AFTER_SECONDS", "1"))
+
+# Provider routing: "sequential" falls back on error, "hedged" starts the next provider once
+# the current one exceeds its p95 latency, "race" calls all providers and keeps the first valid answer
+PROVIDER_ORDER = [name.strip() for name in os.getenv("PROVIDER_ORDER", "llama_cpp,hugging_face,gemini,groq").split(",") if name.strip()]
+PROVIDER_ROUTING_MODE = os.getenv("PROVIDER_ROUTING_MODE", "sequential")
+# Hedge budget used until a provider has HEDGE_MIN_SAMPLES latency samples for its p95
+HEDGE_DELAY_SECONDS = float(os.getenv("HEDGE_DELAY_SECONDS", "2"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+
+# Per-provider circuit breakers; calls slower than the latency threshold count as failures
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_LATENCY_THRESHOLD_SECONDS = float(os.getenv("CIRCUIT_LATENCY_THRESHOLD_SECONDS", "15"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+CIRCUIT_HALF_OPEN_PROBES = int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", "1"))
+# Health scores use at most CIRCUIT_WINDOW outcomes from the last CIRCUIT_WINDOW_SECONDS
+CIRCUIT_WINDOW = int(os.getenv("CIRCUIT_WINDOW", "50"))
+CIRCUIT_WINDOW_SECONDS = float(os.getenv("CIRCUIT_WINDOW_SECONDS", "60"))
+
+# Pooled keep-alive HTTP transport shared by the LLM providers
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+PROVIDER_MAX_CONNECTIONS = _provider_map("PROVIDER_MAX_CONNECTIONS", int)
+# Stream Hugging Face and Gemini completions and close the stream as soon as a complete
+# taxonomy object has been parsed, instead of waiting for max_tokens or end of generation
+PROVIDER_STREAMING = os.getenv("PROVIDER_STREAMING", "true").lower() == "true"
 
 HF_API_KEY = os.getenv("HF_API_KEY")
 HF_MODEL = "meta-llama/Llama-3.1-8B-Instruct"
+HF_CHAT_COMPLETIONS_URL = "https://router.huggingface.co/v1/chat/completions"
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-GEMINI_MODEL = "gemini-1.5-flash"
\ No newline at end of file
+GEMINI_MODEL = "gemini-1.5-flash"
+
+# Local llama.cpp model; the provider is only enabled when LLAMA_MODEL_PATH points at a GGUF file
+LLAMA_MODEL_PATH = os.getenv("LLAMA_MODEL_PATH", "")
+LLAMA_N_CTX = int(os.getenv("LLAMA_N_CTX", "4096"))
+# 0 lets llama.cpp use all physical cores
+LLAMA_N_THREADS = int(os.getenv("LLAMA_N_THREADS", "0"))
+LLAMA_N_BATCH = int(os.getenv("LLAMA_N_BATCH", "512"))
+LLAMA_N_GPU_LAYERS = int(os.getenv("LLAMA_N_GPU_LAYERS", "0"))
+# Empty uses the chat template stored in the GGUF metadata
+LLAMA_CHAT_FORMAT = os.getenv("LLAMA_CHAT_FORMAT") or None
+LLAMA_MAX_TOKENS = int(os.getenv("LLAMA_MAX_TOKENS", "100"))
+# "generate" decodes grammar-constrained JSON; "likelihood" scores every taxonomy path in one
+# pass and reports the softmax probability of the best path as confidence
+CLASSIFICATION_MODE = os.getenv("CLASSIFICATION_MODE", "generate")
+# Softmax temperature over path log-likelihoods; 1.0 is uncalibrated. Fit it on held-out
+# labelled rows with `python evaluate_model.py fit-temperature` to calibrate confidence
+LIKELIHOOD_TEMPERATURE = float(os.getenv("LIKELIHOOD_TEMPERATURE", "1.0"))
\ No newline at end of file
@@ -0,0 +1,120 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Dict
+
+from app.constants import (
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_HALF_OPEN_PROBES,
+    CIRCUIT_LATENCY_THRESHOLD_SECONDS,
+    CIRCUIT_OPEN_SECONDS,
+    CIRCUIT_WINDOW,
+    CIRCUIT_WINDOW_SECONDS,
+)
+from app.llm.provider import LLMProviderError
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpenError(LLMProviderError):
+    pass
+
+class CircuitBreaker:
+    # Consecutive errors or over-threshold latencies open the circuit. After open_seconds a
+    # limited number of half-open probes decide whether it closes again or reopens.
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        latency_threshold: float = CIRCUIT_LATENCY_THRESHOLD_SECONDS,
+        open_seconds: float = CIRCUIT_OPEN_SECONDS,
+        half_open_probes: int = CIRCUIT_HALF_OPEN_PROBES,
+        window: int = CIRCUIT_WINDOW,
+        window_seconds: float = CIRCUIT_WINDOW_SECONDS,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.latency_threshold = latency_threshold
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probes_in_flight = 0
+        # (timestamp, score): 1.0 for a healthy call, 0.5 for a slow one, 0.0 for an error.
+        # Old outcomes age out so a provider demoted by past errors regains its place.
+        self.window_seconds = window_seconds
+        self.outcomes = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def _transition(self, state: str):
+        if state != self.state:
+            logger.warning(f"Circuit for {self.name}: {self.state} -> {state}")
+            self.state = state
+            self.probes_in_flight = 0
+            if state == OPEN:
+                self.opened_at = time.monotonic()
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+                self._transition(HALF_OPEN)
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and self.probes_in_flight < self.half_open_probes:
+                self.probes_in_flight += 1
+                return True
+            return False
+
+    def release_probe(self):
+        # A probe that was cancelled (e.g. lost a race) neither closes nor reopens the circuit
+        with self._lock:
+            if self.state == HALF_OPEN and self.probes_in_flight:
+                self.probes_in_flight -= 1
+
+    def record_success(self, latency: float):
+        if latency > self.latency_threshold:
+            logger.warning(f"{self.name} answered in {latency:.2f}s, over the {self.latency_threshold}s threshold")
+            self._record_failure(0.5)
+            return
+        with self._lock:
+            self.outcomes.append((time.monotonic(), 1.0))
+            self.consecutive_failures = 0
+            if self.state == HALF_OPEN:
+                self._transition(CLOSED)
+
+    def record_failure(self):
+        self._record_failure(0.0)
+
+    def _record_failure(self, outcome: float):
+        with self._lock:
+            self.outcomes.append((time.monotonic(), outcome))
+            self.consecutive_failures += 1
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self._transition(OPEN)
+
+    def health_score(self) -> float:
+        with self._lock:
+            if self.state == OPEN:
+                return 0.0
+            cutoff = time.monotonic() - self.window_seconds
+            while self.outcomes and self.outcomes[0][0] < cutoff:
+                self.outcomes.popleft()
+            if not self.outcomes:
+                return 1.0
+            return sum(score for _, score in self.outcomes) / len(self.outcomes)
+
+    def snapshot(self) -> Dict[str, Any]:
+        score = self.health_score()
+        with self._lock:
+            return {
+                "state": self.state,
+                "health_score": round(score, 4),
+                "consecutive_failures": self.consecutive_failures,
+                "samples": len(self.outcomes),
+            }
@@ -0,0 +1,78 @@
+import json
+import logging
+from typing import Any, List
+import numpy as np
+
+from app.constants import CONTEXT_DEDUPE_SIMILARITY, CONTEXT_TOKEN_BUDGET
+from app.llm.fast_path import gold_label
+from app.llm.provider import estimate_tokens
+from app.llm.result_cache import normalize_conversation
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+NO_KNOWLEDGE = "No relevant knowledge found."
+
+def format_example(conversation: str, label: tuple) -> str:
+    primary, secondary, tertiary = label
+    output = json.dumps(
+        {"primary_topic": primary, "secondary_topic": secondary, "tertiary_topic": tertiary},
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return f"CONVERSATION:\n{json.dumps(conversation, ensure_ascii=False)}\nJSON:\n{output}"
+
+def _is_near_duplicate(vector, kept_vectors: List[np.ndarray], threshold: float) -> bool:
+    if vector is None or not kept_vectors:
+        return False
+    vector = np.asarray(vector, dtype=np.float32)
+    vector = vector / max(float(np.linalg.norm(vector)), 1e-12)
+    return any(float(vector @ kept) >= threshold for kept in kept_vectors)
+
+def assemble_context(
+    hits: List[Any],
+    token_budget: int = CONTEXT_TOKEN_BUDGET,
+    dedupe_similarity: float = CONTEXT_DEDUPE_SIMILARITY,
+) -> str:
+    # Packs the nearest labelled KB conversations, most similar first, as few-shot examples.
+    # Near-identical neighbours add tokens but no information, so only the first is kept.
+    examples: List[str] = []
+    seen_texts = set()
+    kept_vectors: List[np.ndarray] = []
+    used = 0
+
+    for hit in hits:
+        payload = hit.payload or {}
+        text = payload.get("conversation_text")
+        label = gold_label(payload)
+        if not text or label is None:
+            continue
+
+        key = normalize_conversation(text)
+        if key in seen_texts or _is_near_duplicate(hit.vector, kept_vectors, dedupe_similarity):
+            logger.info(f"Skipping near-duplicate example {payload.get('conversation_id')}")
+            continue
+
+        example = format_example(text, label)
+        cost = estimate_tokens(example) + 1
+        if used + cost > token_budget:
+            if examples:
+                continue
+            # Always keep the closest example, trimmed to fit the budget
+            overflow = (used + cost - token_budget) * 4
+            example = format_example(text[: max(0, len(text) - overflow)] + "...", label)
+            cost = estimate_tokens(example) + 1
+
+        examples.append(example)
+        used += cost
+        seen_texts.add(key)
+        if hit.vector is not None:
+            vector = np.asarray(hit.vector, dtype=np.float32)
+            kept_vectors.append(vector / max(float(np.linalg.norm(vector)), 1e-12))
+
+    if not examples:
+        logger.warning("No relevant knowledge found")
+        return NO_KNOWLEDGE
+
+    logger.info(f"Assembled {len(examples)} few-shot examples (~{used} tokens)")
+    return "\n\n".join(examples)
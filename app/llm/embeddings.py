@@ -1,35 +1,189 @@
-import pandas as pd
+import asyncio
+import csv
+import hashlib
+import json
 import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from fastembed import TextEmbedding
 from typing import List, Dict, Any
 import numpy as np
 
-from app.constants import KNOWLEDGE_BASE_PATH
+from app.constants import EMBEDDING_BATCH_SIZE, EMBEDDING_CACHE_DIR, EMBEDDING_POOL_SIZE, EMBEDDING_THREADS, KNOWLEDGE_BASE_PATH
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-worker deployments only
+    fcntl = None
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+LABEL_COLUMNS = ("primary_topic", "secondary_topic", "tertiary_topic")
+
 EMBEDDING_MODEL = "BAAI/bge-small-en-v1.5"
 
-def parse_knowledge_base() -> List[Dict[str, Any]]:
+_embedding_executor = ThreadPoolExecutor(max_workers=EMBEDDING_POOL_SIZE, thread_name_prefix="embedding")
+
+_text_embedder: TextEmbedding | None = None
+_text_embedder_lock = threading.Lock()
+
+def get_text_embedder() -> TextEmbedding:
+    global _text_embedder
+    if _text_embedder is None:
+        with _text_embedder_lock:
+            if _text_embedder is None:
+                logger.info(f"Initializing text embedder {EMBEDDING_MODEL} (threads: {EMBEDDING_THREADS or 'auto'})...")
+                _text_embedder = TextEmbedding(EMBEDDING_MODEL, threads=EMBEDDING_THREADS or None)
+                logger.info("Text embedder initialized")
+    return _text_embedder
+
+def warm_up_embedder():
+    # The first forward pass allocates ONNX buffers; pay for it before serving traffic
+    logger.info("Warming up text embedder...")
+    list(get_text_embedder().embed(documents=["warm up"], batch_size=EMBEDDING_BATCH_SIZE))
+    logger.info("Text embedder warmed up")
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def content_hash(conversation: Dict[str, Any]) -> str:
+    # A KB row changes when its text or any of its labels does
+    return hash_text(json.dumps([conversation['text'], *(conversation.get(column) for column in LABEL_COLUMNS)]))
+
+class EmbeddingStore:
+    # Vectors live in a raw float32 matrix that is memory-mapped on load; the index
+    # maps each text hash to its row. Rows are appended before the index is rewritten,
+    # so a crash can only leave unreferenced rows at the end of the file; those are
+    # truncated away before the next append so new rows line up with their index entries.
+    # Writers hold an exclusive file lock, so workers can share EMBEDDING_CACHE_DIR.
+    def __init__(self, directory: str, model_name: str):
+        self.model_name = model_name
+        file_stem = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        self.vectors_path = os.path.join(directory, f"{file_stem}.f32")
+        self.index_path = os.path.join(directory, f"{file_stem}.index.json")
+        self.lock_path = os.path.join(directory, f"{file_stem}.lock")
+        self.dim = 0
+        self.rows: Dict[str, int] = {}
+        self.matrix = None
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        with self._lock, self._file_lock():
+            self._sync()
+        logger.info(f"Loaded embedding store with {len(self.rows)} vectors (dim {self.dim})")
+
+    @contextmanager
+    def _file_lock(self):
+        with open(self.lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_index(self):
+        if not os.path.exists(self.index_path) or not os.path.exists(self.vectors_path):
+            return 0, []
+
+        with open(self.index_path, "r") as f:
+            index = json.load(f)
+
+        if index.get("model") != self.model_name:
+            logger.warning(f"Embedding store model mismatch ({index.get('model')}), starting empty")
+            return 0, []
+
+        dim = index["dim"]
+        keys = index["keys"]
+        stored_rows = os.path.getsize(self.vectors_path) // (4 * dim) if dim else 0
+        if stored_rows < len(keys):
+            logger.warning(f"Embedding store truncated: {stored_rows} rows for {len(keys)} keys")
+            keys = keys[:stored_rows]
+        return dim, keys
+
+    def _sync(self):
+        # Must hold the file lock: adopts rows other workers added and drops orphaned rows
+        self.dim, keys = self._read_index()
+        expected_size = len(keys) * self.dim * 4
+        if os.path.exists(self.vectors_path) and os.path.getsize(self.vectors_path) != expected_size:
+            logger.warning(f"Dropping {os.path.getsize(self.vectors_path) - expected_size} orphaned bytes from embedding store")
+            os.truncate(self.vectors_path, expected_size)
+        self.rows = {key: row for row, key in enumerate(keys)}
+        self._map(len(keys))
+
+    def _map(self, n_rows: int):
+        if n_rows == 0:
+            self.matrix = None
+            return
+        self.matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(n_rows, self.dim))
+
+    def get(self, key: str) -> np.ndarray | None:
+        row = self.rows.get(key)
+        if row is None or self.matrix is None:
+            return None
+        return np.array(self.matrix[row])
+
+    def put_many(self, keys: List[str], vectors: List[np.ndarray]):
+        with self._lock, self._file_lock():
+            self._sync()
+            new_rows = {}
+            for key, vector in zip(keys, vectors):
+                if key not in self.rows and key not in new_rows:
+                    new_rows[key] = vector
+            if not new_rows:
+                return
+
+            keys = list(new_rows)
+            matrix = np.asarray(list(new_rows.values()), dtype=np.float32)
+            if self.dim and matrix.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {matrix.shape[1]} does not match store dimension {self.dim}")
+            self.dim = matrix.shape[1]
+
+            with open(self.vectors_path, "ab") as f:
+                f.write(matrix.tobytes())
+
+            rows = dict(self.rows)
+            for key in keys:
+                rows[key] = len(rows)
+
+            ordered_keys = sorted(rows, key=rows.get)
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"model": self.model_name, "dim": self.dim, "keys": ordered_keys}, f)
+            os.replace(tmp_path, self.index_path)
+
+            self.rows = rows
+            self._map(len(rows))
+            logger.info(f"Stored {len(keys)} new embeddings ({len(rows)} total)")
+
+_embedding_store: EmbeddingStore | None = None
+
+def get_embedding_store() -> EmbeddingStore:
+    global _embedding_store
+    if _embedding_store is None:
+        _embedding_store = EmbeddingStore(EMBEDDING_CACHE_DIR, EMBEDDING_MODEL)
+    return _embedding_store
+
+def knowledge_base_record(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'id': int(row['conversation_id']),
+        'text': row['conversation'] or "",
+        # Gold labels, where present, feed the fast-path classifier
+        **{column: row.get(column) or None for column in LABEL_COLUMNS if column in row},
+        'embedding': None
+    }
+
+def parse_knowledge_base(path: str = KNOWLEDGE_BASE_PATH) -> List[Dict[str, Any]]:
     logger.info("Starting knowledge base parsing...")
-    logger.info(f"Reading CSV file: app/data/conversations.csv")
+    logger.info(f"Reading CSV file: {path}")
     
-    conversations_df = pd.read_csv(KNOWLEDGE_BASE_PATH, dtype={
-        'conversation_id': 'int64', 
-        'conversation': 'string'
-    })
-    
-    logger.info(f"Loaded {len(conversations_df)} conversations from CSV")
-    
-    conversations = [
-        {
-            'id': int(row['conversation_id']),
-            'text': row['conversation'],
-            'embedding': None
-        }
-        for _, row in conversations_df.iterrows()
-    ]
+    with open(path, newline="", encoding="utf-8") as f:
+        conversations = [knowledge_base_record(row) for row in csv.DictReader(f)]
     
     logger.info(f"Parsed {len(conversations)} conversation records")
     return conversations
@@ -38,37 +192,43 @@ def convert_conversations_to_embeddings(conversations: List[Dict[str, Any]]) ->
     logger.info(f"Starting embedding conversion for {len(conversations)} conversations...")
     logger.info(f"Using embedding model: {EMBEDDING_MODEL}")
     
-    logger.info("Initializing text embedder...")
-    text_embedder = TextEmbedding(EMBEDDING_MODEL)
-    logger.info("Text embedder initialized")
+    # Rows that already carry a vector (e.g. reused from a persistent Qdrant index) are left alone
+    pending = [conv for conv in conversations if conv['embedding'] is None]
+    store = get_embedding_store()
+    hashes = [hash_text(conv['text']) for conv in pending]
+    for conv, text_hash in zip(pending, hashes):
+        conv['embedding'] = store.get(text_hash)
     
-    logger.info("Extracting conversation texts...")
-    texts = [conv['text'] for conv in conversations]
-    logger.info(f"Extracted {len(texts)} texts for embedding")
+    missing = [i for i, conv in enumerate(pending) if conv['embedding'] is None]
+    logger.info(f"Found {len(conversations) - len(missing)} cached embeddings, {len(missing)} to generate")
     
-    logger.info("Generating embeddings (this may take a while)...")
-    embeddings = list(text_embedder.embed(documents=texts))
-    logger.info(f"Generated {len(embeddings)} embeddings")
-    
-    logger.info("Adding embeddings to conversation data...")
-    for i, conv in enumerate(conversations):
-        conv['embedding'] = np.array(embeddings[i])
-        if i % 10 == 0:  # Log progress every 10 conversations
-            logger.info(f"Processed {i+1}/{len(conversations)} conversations")
+    if missing:
+        text_embedder = get_text_embedder()
+        
+        logger.info("Extracting conversation texts...")
+        texts = [pending[i]['text'] for i in missing]
+        logger.info(f"Extracted {len(texts)} texts for embedding")
+        
+        logger.info("Generating embeddings (this may take a while)...")
+        embeddings = list(text_embedder.embed(documents=texts, batch_size=EMBEDDING_BATCH_SIZE))
+        logger.info(f"Generated {len(embeddings)} embeddings")
+        
+        logger.info("Adding embeddings to conversation data...")
+        for n, i in enumerate(missing):
+            pending[i]['embedding'] = np.array(embeddings[n])
+            if n % 10 == 0:  # Log progress every 10 conversations
+                logger.info(f"Processed {n+1}/{len(missing)} conversations")
+        
+        store.put_many([hashes[i] for i in missing], embeddings)
     
     logger.info("Embedding conversion completed successfully")
     return conversations
 
-def convert_conversation_to_embedding(conversation: str) -> np.ndarray:
-    logger.info(f"Converting single conversation to embedding (length: {len(conversation)} chars)")
-    logger.info(f"Using embedding model: {EMBEDDING_MODEL}")
-    
-    logger.info("Initializing text embedder...")
-    text_embedder = TextEmbedding(EMBEDDING_MODEL)
-    
-    logger.info("Generating embedding...")
-    embedding = next(iter(text_embedder.embed(documents=[conversation])))
-    result = np.array(embedding)
-    
-    logger.info(f"Generated embedding with shape: {result.shape}")
-    return result
\ No newline at end of file
+async def run_in_embedding_pool(func, *args):
+    # ONNX inference and vector search are CPU-bound; keep them off the event loop
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_embedding_executor, func, *args)
+
+def embed_texts(texts: List[str]) -> List[np.ndarray]:
+    embeddings = get_text_embedder().embed(documents=texts, batch_size=EMBEDDING_BATCH_SIZE)
+    return [np.array(embedding) for embedding in embeddings]
@@ -0,0 +1,84 @@
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple
+import numpy as np
+
+from app.constants import FAST_PATH_MIN_AGREEMENT, FAST_PATH_MIN_SIMILARITY, FAST_PATH_TOP_K
+from app.schemas.taxonomy_data import TaxonomyOutput
+from app.taxonomy.index import TAXONOMY_INDEX
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+def gold_label(conversation: Dict[str, Any]) -> Tuple[str, str, str] | None:
+    # KB rows with a missing or off-taxonomy label can't vote
+    labels = (conversation.get("primary_topic"), conversation.get("secondary_topic"), conversation.get("tertiary_topic"))
+    return labels if TAXONOMY_INDEX.is_valid_path(*labels) else None
+
+class FastPathClassifier:
+    # Similarity-weighted kNN vote over the labelled KB embeddings. A ticket is only answered
+    # without the LLM when its nearest neighbour is close enough and the neighbours agree.
+    def __init__(
+        self,
+        conversations: List[Dict[str, Any]],
+        top_k: int = FAST_PATH_TOP_K,
+        min_similarity: float = FAST_PATH_MIN_SIMILARITY,
+        min_agreement: float = FAST_PATH_MIN_AGREEMENT,
+    ):
+        self.top_k = top_k
+        self.min_similarity = min_similarity
+        self.min_agreement = min_agreement
+        self.stats_counters = {"hits": 0, "escalations": 0}
+        self._lock = threading.Lock()
+
+        labelled = [(conv["embedding"], label) for conv in conversations if (label := gold_label(conv))]
+        self.labels = [label for _, label in labelled]
+        self.matrix = None
+        if labelled:
+            matrix = np.stack([np.asarray(embedding, dtype=np.float32) for embedding, _ in labelled])
+            self.matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        logger.info(f"Fast path classifier: {len(self.labels)} labelled KB rows, enabled: {self.enabled}")
+
+    @property
+    def enabled(self) -> bool:
+        return self.min_similarity > 0 and self.matrix is not None
+
+    def classify(self, query_embedding: np.ndarray) -> TaxonomyOutput | None:
+        if not self.enabled:
+            return None
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        similarities = self.matrix @ (query / max(float(np.linalg.norm(query)), 1e-12))
+        k = min(self.top_k, len(similarities))
+        nearest = np.argpartition(-similarities, k - 1)[:k]
+
+        votes = defaultdict(float)
+        for i in nearest:
+            votes[self.labels[i]] += max(float(similarities[i]), 0.0)
+        label, weight = max(votes.items(), key=lambda item: item[1])
+        total = sum(votes.values())
+        agreement = weight / total if total else 0.0
+        best_similarity = float(similarities[nearest].max())
+
+        if best_similarity < self.min_similarity or agreement < self.min_agreement:
+            self._count("escalations")
+            logger.info(f"Fast path escalating: similarity {best_similarity:.3f}, agreement {agreement:.2f}")
+            return None
+
+        self._count("hits")
+        logger.info(f"Fast path hit: {label} (similarity {best_similarity:.3f}, agreement {agreement:.2f})")
+        return TaxonomyOutput(
+            primary_topic=label[0],
+            secondary_topic=label[1],
+            tertiary_topic=label[2],
+            confidence=round(agreement * best_similarity, 4),
+        )
+
+    def _count(self, counter: str):
+        with self._lock:
+            self.stats_counters[counter] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"enabled": self.enabled, "labelled_rows": len(self.labels), **self.stats_counters}
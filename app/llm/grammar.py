@@ -0,0 +1,49 @@
+import json
+from typing import List
+
+from app.taxonomy.index import TaxonomyIndex
+
+def _literal(text: str) -> str:
+    # GBNF string literals use the same escaping as JSON strings
+    return json.dumps(text, ensure_ascii=False)
+
+def _json_field(name: str, value: str | None = None, first: bool = False) -> str:
+    prefix = "" if first else ","
+    if value is None:
+        return _literal(f'{prefix}"{name}":')
+    return _literal(f'{prefix}"{name}":{json.dumps(value, ensure_ascii=False)}')
+
+def build_taxonomy_grammar(index: TaxonomyIndex) -> str:
+    # Compact JSON whose label fields can only spell a valid primary -> secondary -> tertiary
+    # path, so the output always parses and validates and carries no extra tokens
+    rules: List[str] = [
+        f'root ::= "{{" path {_json_field("confidence")} confidence "}}"',
+        'confidence ::= "0." [0-9] [0-9]? | "1.0"',
+    ]
+    primary_rules = []
+    secondary_index = 0
+    for i, primary in enumerate(index.primaries):
+        secondary_rules = []
+        for secondary in index.children[primary]:
+            tertiaries = index.children[secondary]
+            if not tertiaries:
+                continue
+            name = f"secondary-{secondary_index}"
+            secondary_index += 1
+            options = " | ".join(_literal(json.dumps(tertiary, ensure_ascii=False)) for tertiary in tertiaries)
+            rules.append(
+                f'{name} ::= {_literal(json.dumps(secondary, ensure_ascii=False))} '
+                f'{_json_field("tertiary_topic")} ( {options} )'
+            )
+            secondary_rules.append(name)
+        if not secondary_rules:
+            continue
+        name = f"primary-{i}"
+        rules.append(
+            f'{name} ::= {_json_field("primary_topic", primary, first=True)} '
+            f'{_json_field("secondary_topic")} ( {" | ".join(secondary_rules)} )'
+        )
+        primary_rules.append(name)
+
+    rules.insert(1, f'path ::= {" | ".join(primary_rules)}')
+    return "\n".join(rules) + "\n"
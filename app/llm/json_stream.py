@@ -0,0 +1,79 @@
+import json
+from typing import Any, Dict, Tuple
+
+TAXONOMY_KEYS = ("primary_topic", "secondary_topic", "tertiary_topic", "confidence")
+
+def _find_taxonomy_object(value: Any, required_keys: Tuple[str, ...]) -> Dict[str, Any] | None:
+    # Models sometimes wrap the answer, e.g. {"classification": {...}}
+    if isinstance(value, dict):
+        if all(key in value for key in required_keys):
+            return value
+        for child in value.values():
+            found = _find_taxonomy_object(child, required_keys)
+            if found is not None:
+                return found
+    return None
+
+class IncrementalJSONExtractor:
+    # Brace-balancing scanner that can be fed a completion chunk by chunk. Braces inside JSON
+    # strings are ignored, nested objects are kept whole, and as soon as a top-level object
+    # carrying all required keys has closed, `result` is set so the caller can stop reading.
+    def __init__(self, required_keys: Tuple[str, ...] = TAXONOMY_KEYS):
+        self.required_keys = required_keys
+        self.text = ""
+        self.first_object: Dict[str, Any] | None = None
+        self.result: Dict[str, Any] | None = None
+        self._pos = 0
+        self._depth = 0
+        self._start = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> Dict[str, Any] | None:
+        self.text += chunk
+        text = self.text
+        while self._pos < len(text) and self.result is None:
+            char = text[self._pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"' and self._depth:
+                self._in_string = True
+            elif char == "{":
+                if not self._depth:
+                    self._start = self._pos
+                self._depth += 1
+            elif char == "}" and self._depth:
+                self._depth -= 1
+                if not self._depth:
+                    self._close_object(text[self._start : self._pos + 1])
+            self._pos += 1
+        return self.result
+
+    def _close_object(self, candidate: str):
+        try:
+            value = json.loads(candidate)
+        except json.JSONDecodeError:
+            # Prose such as "{see below}" balances but isn't JSON
+            return
+        if not isinstance(value, dict):
+            return
+        if self.first_object is None:
+            self.first_object = value
+        self.result = _find_taxonomy_object(value, self.required_keys)
+
+    def best(self) -> Dict[str, Any] | None:
+        return self.result if self.result is not None else self.first_object
+
+def extract_json_object(raw: str, required_keys: Tuple[str, ...] = TAXONOMY_KEYS) -> Dict[str, Any]:
+    # The first object with every required key, else the first object that parses at all
+    extractor = IncrementalJSONExtractor(required_keys)
+    extractor.feed(raw)
+    value = extractor.best()
+    if value is None:
+        raise ValueError("No JSON object found")
+    return value
@@ -1,42 +1,200 @@
+import asyncio
 import logging
-from qdrant_client import QdrantClient
-from app.llm.embeddings import convert_conversation_to_embedding, convert_conversations_to_embeddings, parse_knowledge_base
-from app.llm.vector_db import VectorDB
+import os
+import threading
+import time
+import numpy as np
+from typing import Any, Dict, Iterable, List
+from app.constants import CONTEXT_TOP_K, KB_WATCH_INTERVAL_SECONDS, KNOWLEDGE_BASE_PATH, QDRANT_COLLECTION, QDRANT_MODE
+from app.llm.context_assembler import assemble_context
+from app.llm.embedding_batcher import get_embedding_batcher
+from app.llm.embeddings import content_hash, convert_conversations_to_embeddings, embed_texts, parse_knowledge_base, run_in_embedding_pool
+from app.llm.fast_path import FastPathClassifier
+from app.llm.vector_db import VectorDB, create_qdrant_client, load_stored_embeddings
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-def retrieve_knowledge(query: str) -> str:
-    logger.info(f"Starting knowledge retrieval for query: {query[:100]}...")
-    
-    logger.info("Parsing knowledge base...")
-    conversations = parse_knowledge_base()
-    logger.info(f"Parsed {len(conversations)} conversations from knowledge base")
-    
-    logger.info("Converting conversations to embeddings...")
-    conversations_with_embeddings = convert_conversations_to_embeddings(conversations)
-    logger.info("Conversations converted to embeddings successfully")
-    
-    logger.info("Initializing vector database...")
-    vector_db = VectorDB(
-        client=QdrantClient(":memory:"), 
-        collection_name="conversations", 
-        conversations=conversations_with_embeddings
-    )
-    logger.info("Vector database initialized")
-    
-    logger.info("Converting query to embedding...")
-    query_embedding = convert_conversation_to_embedding(query)
-    logger.info("Query embedding generated")
-    
-    logger.info("Searching for similar conversations...")
-    results = vector_db.search_vectors(query_vector=query_embedding)
-    logger.info(f"Found {len(results)} similar conversations")
-    
-    if results and len(results) > 0 and results[0].payload:
-        result_text = results[0].payload.get('conversation_text', 'No conversation text found')
-        logger.info(f"Returning top result: {len(result_text)} characters")
-        return result_text
-    
-    logger.warning("No relevant knowledge found")
-    return "No relevant knowledge found."
\ No newline at end of file
+class KnowledgeRetriever:
+    def __init__(self, collection_name: str = QDRANT_COLLECTION):
+        logger.info("Building knowledge retriever...")
+
+        logger.info("Parsing knowledge base...")
+        self.kb_mtime = self._kb_mtime()
+        conversations = parse_knowledge_base(KNOWLEDGE_BASE_PATH)
+        logger.info(f"Parsed {len(conversations)} conversations from knowledge base")
+
+        client = create_qdrant_client()
+        load_stored_embeddings(client, collection_name, conversations)
+
+        logger.info("Converting conversations to embeddings...")
+        conversations_with_embeddings = convert_conversations_to_embeddings(conversations)
+        logger.info("Conversations converted to embeddings successfully")
+
+        logger.info("Initializing vector database...")
+        self.vector_db = VectorDB(
+            client=client,
+            collection_name=collection_name,
+            conversations=conversations_with_embeddings,
+            local=QDRANT_MODE != "server"
+        )
+        self.fast_path = FastPathClassifier(conversations_with_embeddings)
+
+        # Live rows by conversation_id, and the hashes last read from the source file; file
+        # reloads diff against the latter so admin API edits survive unrelated file changes
+        self.conversations: Dict[int, Dict[str, Any]] = {conv['id']: conv for conv in conversations_with_embeddings}
+        self.content_hashes = {conv_id: content_hash(conv) for conv_id, conv in self.conversations.items()}
+        self.file_hashes = dict(self.content_hashes)
+        # Bumped on every change; classifications cached against an older revision are dropped
+        self.revision = 0
+        self.kb_stats_counters = {"reloads": 0, "total_upserted": 0, "total_deleted": 0, "last_update": None}
+        # Writers serialise on _update_lock only around the index write and dict swap; the
+        # counters have their own lock so /health never waits behind an update
+        self._update_lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        logger.info("Knowledge retriever ready")
+
+    def _kb_mtime(self) -> float | None:
+        try:
+            return os.path.getmtime(KNOWLEDGE_BASE_PATH)
+        except OSError:
+            return None
+
+    def upsert_conversations(self, conversations: List[Dict[str, Any]]) -> int:
+        # Only new or edited rows are embedded and written; searches keep running meanwhile
+        # against the live collection, and the fast path is swapped in one assignment.
+        # Embedding is the slow part, so it happens before the lock is taken.
+        hashes = {conv['id']: content_hash(conv) for conv in conversations}
+        changed = {conv['id']: conv for conv in conversations if self.content_hashes.get(conv['id']) != hashes[conv['id']]}
+        if not changed:
+            return 0
+        convert_conversations_to_embeddings(list(changed.values()))
+
+        with self._update_lock:
+            # Drop rows a concurrent call has written in the meantime
+            changed = {conv_id: conv for conv_id, conv in changed.items() if self.content_hashes.get(conv_id) != hashes[conv_id]}
+            if not changed:
+                return 0
+
+            self.vector_db.upsert_conversations(list(changed.values()))
+            for conv_id, conv in changed.items():
+                self.conversations[conv_id] = conv
+                self.content_hashes[conv_id] = hashes[conv_id]
+            self._rebuild_fast_path()
+            self._record("total_upserted", len(changed))
+            logger.info(f"Knowledge base upserted {len(changed)} conversations ({len(self.conversations)} total)")
+            return len(changed)
+
+    def delete_conversations(self, conversation_ids: Iterable[int]) -> int:
+        with self._update_lock:
+            deleted = [conv_id for conv_id in set(conversation_ids) if conv_id in self.conversations]
+            if not deleted:
+                return 0
+
+            self.vector_db.delete_conversations(deleted)
+            for conv_id in deleted:
+                del self.conversations[conv_id]
+                del self.content_hashes[conv_id]
+            self._rebuild_fast_path()
+            self._record("total_deleted", len(deleted))
+            logger.info(f"Knowledge base deleted {len(deleted)} conversations ({len(self.conversations)} total)")
+            return len(deleted)
+
+    def reload_knowledge_base(self, force: bool = False) -> Dict[str, int] | None:
+        # Applies the rows added, edited or removed in the source file since it was last read
+        with self._reload_lock:
+            mtime = self._kb_mtime()
+            if mtime is None or (mtime == self.kb_mtime and not force):
+                return None
+
+            conversations = parse_knowledge_base(KNOWLEDGE_BASE_PATH)
+            file_hashes = {conv['id']: content_hash(conv) for conv in conversations}
+            edited = [conv for conv in conversations if self.file_hashes.get(conv['id']) != file_hashes[conv['id']]]
+            removed = [conv_id for conv_id in self.file_hashes if conv_id not in file_hashes]
+
+            changes = {"upserted": self.upsert_conversations(edited), "deleted": self.delete_conversations(removed)}
+            self.file_hashes, self.kb_mtime = file_hashes, mtime
+            with self._stats_lock:
+                self.kb_stats_counters["reloads"] += 1
+            return changes
+
+    def _rebuild_fast_path(self):
+        fast_path = FastPathClassifier(list(self.conversations.values()))
+        fast_path.stats_counters = self.fast_path.stats_counters
+        self.fast_path = fast_path
+        self.revision += 1
+
+    def _record(self, counter: str, count: int):
+        with self._stats_lock:
+            self.kb_stats_counters[counter] += count
+            self.kb_stats_counters["last_update"] = time.time()
+
+    def kb_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {"conversations": len(self.conversations), "revision": self.revision, **self.kb_stats_counters}
+
+    async def aembed_query(self, query: str) -> np.ndarray:
+        logger.info("Converting query to embedding...")
+        query_embedding = await get_embedding_batcher().embed(query)
+        logger.info("Query embedding generated")
+        return query_embedding
+
+    async def aembed_queries(self, queries: List[str]) -> List[np.ndarray]:
+        # A batch is already one forward pass, so it bypasses the micro-batcher
+        logger.info(f"Converting {len(queries)} queries to embeddings...")
+        return await run_in_embedding_pool(embed_texts, queries)
+
+    async def aretrieve(self, query: str, query_embedding: np.ndarray | None = None) -> str:
+        logger.info(f"Starting async knowledge retrieval for query: {query[:100]}...")
+
+        if query_embedding is None:
+            query_embedding = await self.aembed_query(query)
+
+        return await run_in_embedding_pool(self._search, query_embedding)
+
+    async def aretrieve_batch(self, query_embeddings: List[np.ndarray]) -> List[str]:
+        logger.info(f"Starting batch knowledge retrieval for {len(query_embeddings)} queries...")
+        return await run_in_embedding_pool(self._search_batch, query_embeddings)
+
+    def _search(self, query_embedding: np.ndarray) -> str:
+        logger.info("Searching for similar conversations...")
+        results = self.vector_db.search_vectors(query_vector=query_embedding, top_k=CONTEXT_TOP_K)
+        logger.info(f"Found {len(results)} similar conversations")
+        return self._format_results(results)
+
+    def _search_batch(self, query_embeddings: List[np.ndarray]) -> List[str]:
+        if not query_embeddings:
+            return []
+        return [
+            self._format_results(results)
+            for results in self.vector_db.search_vectors_batch(query_embeddings, top_k=CONTEXT_TOP_K)
+        ]
+
+    def _format_results(self, results) -> str:
+        return assemble_context(results)
+
+_retriever: KnowledgeRetriever | None = None
+_retriever_lock = threading.Lock()
+
+def get_retriever() -> KnowledgeRetriever:
+    # Built lazily for scripts such as evaluate_model.py; the API builds it at startup
+    global _retriever
+    if _retriever is None:
+        with _retriever_lock:
+            if _retriever is None:
+                _retriever = KnowledgeRetriever()
+    return _retriever
+
+async def watch_knowledge_base(retriever: KnowledgeRetriever, interval: float = KB_WATCH_INTERVAL_SECONDS):
+    # Polling the mtime needs no extra dependency and also works on Docker bind mounts
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            changes = await run_in_embedding_pool(retriever.reload_knowledge_base)
+        except Exception as e:
+            # Usually a file caught mid-save; the mtime is left untouched so the next poll retries
+            logger.error(f"Knowledge base reload failed: {e}")
+            continue
+        if changes:
+            logger.info(f"Knowledge base reloaded: {changes}")
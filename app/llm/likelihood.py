@@ -0,0 +1,150 @@
+import json
+import logging
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+Path = Tuple[str, str, str]
+
+class _TrieNode:
+    def __init__(self, token: int | None = None, scored: bool = False):
+        self.token = token
+        # Scaffold tokens (JSON keys and punctuation) are fixed by us and not scored
+        self.scored = scored
+        self.children: Dict[Tuple[int, bool], "_TrieNode"] = {}
+        self.path: Path | None = None
+
+def _log_softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = logits - logits.max()
+    return shifted - np.log(np.exp(shifted).sum())
+
+class PathScorer:
+    # Scores every taxonomy path as the continuation
+    #   {"primary_topic":"P","secondary_topic":"S","tertiary_topic":"T"
+    # of a completion-style prompt. Paths share a token trie, so a shared prefix is decoded
+    # once and the KV cache is rewound to the branch point before decoding the next sibling.
+    def __init__(self, model, paths: List[Path], temperature: float = 1.0):
+        self.model = model
+        self.temperature = temperature
+        self.root = _TrieNode()
+        self._tokens: Dict[str, List[int]] = {}
+        for path in paths:
+            self._insert(path)
+        self.max_depth = self._depth(self.root)
+        logger.info(f"Likelihood scorer built for {len(paths)} taxonomy paths")
+
+    def _tokenize(self, text: str) -> List[int]:
+        if text not in self._tokens:
+            self._tokens[text] = self.model.tokenize(text.encode("utf-8"), add_bos=False, special=False)
+        return self._tokens[text]
+
+    def _insert(self, path: Path):
+        node = self.root
+        for key, label in zip(("primary_topic", "secondary_topic", "tertiary_topic"), path):
+            scaffold = f'"{key}":"' if key == "primary_topic" else f',"{key}":"'
+            # Scoring the closing quote tells "Refunds" apart from a longer label starting with it
+            pieces = [(scaffold, False), (json.dumps(label, ensure_ascii=False)[1:], True)]
+            for text, scored in pieces:
+                for token in self._tokenize(text):
+                    node = node.children.setdefault((token, scored), _TrieNode(token, scored))
+        node.path = path
+
+    def _eval(self, tokens: List[int]) -> np.ndarray:
+        # Without logits_all, llama.cpp only keeps the logits of the last token of each
+        # decode (model.scores is not filled), so they are read from the context directly
+        # and copied before the next decode overwrites them
+        model = self.model
+        model.eval(tokens)
+        logits = np.ctypeslib.as_array(model._ctx.get_logits_ith(-1), shape=(model.n_vocab(),))
+        return _log_softmax(logits.astype(np.float64))
+
+    def _eval_prompt(self, tokens: List[int]) -> Tuple[int, np.ndarray]:
+        # Keep whatever prefix of the prompt is already in the KV cache from the previous call
+        # (the system prompt, typically) and only decode the rest
+        model = self.model
+        cached = 0
+        limit = min(model.n_tokens, len(tokens) - 1)
+        while cached < limit and model.input_ids[cached] == tokens[cached]:
+            cached += 1
+        model.n_tokens = cached
+        return cached, self._eval(tokens[cached:])
+
+    def _walk(self, node: _TrieNode, n_past: int, logprob: float, logprobs: np.ndarray, scores: Dict[Path, float]):
+        # logprobs is the next-token distribution after the node's tokens; it is held here
+        # while each child is decoded, since the context only remembers the latest one
+        model = self.model
+        for child in node.children.values():
+            child_logprob = logprob + (logprobs[child.token] if child.scored else 0.0)
+            # Unscored scaffold after this token needs no logits of its own, so it is
+            # decoded in the same batch up to the next branch or scored token
+            tokens = [child.token]
+            end = child
+            while end.path is None and len(end.children) == 1:
+                only = next(iter(end.children.values()))
+                if only.scored:
+                    break
+                tokens.append(only.token)
+                end = only
+            if end.path is not None:
+                scores[end.path] = child_logprob
+                if not end.children:
+                    continue
+            model.n_tokens = n_past
+            child_logprobs = self._eval(tokens)
+            self._walk(end, n_past + len(tokens), child_logprob, child_logprobs, scores)
+
+    def log_likelihoods(self, prompt: str, chat_template: bool = False) -> Tuple[Dict[Path, float], int, int]:
+        # Returns every path's log-likelihood, the number of prompt tokens and how many of
+        # them were reused from the KV cache. A rendered chat template already carries BOS
+        # and special tokens as text. Callers must hold the model's lock.
+        model = self.model
+        tokens = model.tokenize(prompt.encode("utf-8"), add_bos=not chat_template, special=chat_template)
+        if len(tokens) + self.max_depth > model.n_ctx():
+            raise ValueError(f"Prompt of {len(tokens)} tokens leaves no room to score labels")
+
+        cached, logprobs = self._eval_prompt(tokens)
+        logger.info(f"Scoring prompt: {len(tokens)} tokens, {cached} reused from cache")
+
+        log_likelihoods: Dict[Path, float] = {}
+        self._walk(self.root, len(tokens), 0.0, logprobs, log_likelihoods)
+        return log_likelihoods, len(tokens), cached
+
+    def score(self, prompt: str, chat_template: bool = False) -> Tuple[List[Tuple[Path, float]], int, int]:
+        # Paths ranked by probability (softmax over path log-likelihoods at the temperature)
+        log_likelihoods, n_tokens, cached = self.log_likelihoods(prompt, chat_template)
+        paths = list(log_likelihoods)
+        logits = np.array([log_likelihoods[path] for path in paths]) / self.temperature
+        probabilities = np.exp(logits - logits.max())
+        probabilities /= probabilities.sum()
+        ranked = sorted(zip(paths, probabilities.tolist()), key=lambda item: -item[1])
+        return ranked, n_tokens, cached
+
+    def _depth(self, node: _TrieNode) -> int:
+        return 1 + max((self._depth(child) for child in node.children.values()), default=0)
+
+def temperature_nll(samples: List[Tuple[Dict[Path, float], Path]], temperature: float) -> float:
+    # Mean negative log-probability of the gold path
+    total = 0.0
+    for log_likelihoods, gold in samples:
+        paths = list(log_likelihoods)
+        log_probs = _log_softmax(np.array([log_likelihoods[path] for path in paths]) / temperature)
+        total -= log_probs[paths.index(gold)]
+    return total / len(samples)
+
+def fit_temperature(
+    samples: List[Tuple[Dict[Path, float], Path]], min_temperature: float = 0.05, max_temperature: float = 20.0
+) -> float:
+    # NLL is convex in the inverse temperature, so a golden-section search finds the minimum
+    ratio = (np.sqrt(5) - 1) / 2
+    low, high = 1 / max_temperature, 1 / min_temperature
+    for _ in range(80):
+        a = high - ratio * (high - low)
+        b = low + ratio * (high - low)
+        if temperature_nll(samples, 1 / a) <= temperature_nll(samples, 1 / b):
+            high = b
+        else:
+            low = a
+    return 2 / (low + high)
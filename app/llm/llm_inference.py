@@ -1,14 +1,24 @@
-import re
 import json
+import asyncio
 import logging
+import numpy as np
+from typing import List, Tuple
 from pydantic import ValidationError
-from app.llm.knowledge_base import retrieve_knowledge
+from app.constants import BATCH_LLM_CONCURRENCY, LLAMA_MODEL_PATH, PROVIDER_ORDER
+from app.llm.embeddings import embed_texts, run_in_embedding_pool
+from app.llm.json_stream import extract_json_object
+from app.llm.knowledge_base import KnowledgeRetriever, get_retriever
 from app.llm.providers.gemini_provider import GeminiProvider
 from app.llm.providers.groq_provider import GroqProvider
 from app.llm.providers.hf_provider import HuggingFaceProvider
+from app.llm.providers.llama_cpp_provider import LlamaCppProvider
 from app.llm.provider import LLMProviderError
+from app.llm.result_cache import CACHED_USAGE, ClassificationCache, cache_version, normalize_conversation
+from app.llm.router import ProviderRouter
+from app.prompts.prompt_builder import build_repair_user_prompt
 from app.prompts.repair_prompt import repair_prompt
 from app.schemas.taxonomy_data import TaxonomyOutput
+from app.taxonomy.resolver import LabelResolver
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -18,89 +28,184 @@ groq = GroqProvider()
 hugging_face = HuggingFaceProvider()
 gemini = GeminiProvider()
 
-def infer(system_prompt: str, user_prompt: str):
-    logger.info("Starting inference process...")
+providers = {"hugging_face": hugging_face, "gemini": gemini, "groq": groq}
+# The local model is optional; without a GGUF path only the hosted providers are routed
+if LLAMA_MODEL_PATH:
+    providers["llama_cpp"] = LlamaCppProvider()
+provider_router = ProviderRouter(providers, PROVIDER_ORDER)
+
+classification_cache = ClassificationCache()
+label_resolver = LabelResolver(embed=embed_texts)
+
+async def ainfer(system_prompt: str, user_prompt: str, retriever: KnowledgeRetriever | None = None):
+    logger.info("Starting async inference process...")
     logger.info(f"User prompt length: {len(user_prompt)} characters")
     
+    retriever = retriever or get_retriever()
+    version = cache_version(system_prompt, retriever.revision)
+    cached = classification_cache.get_exact(user_prompt, version)
+    if cached is not None:
+        return cached, dict(CACHED_USAGE)
+    
+    query_embedding = await retriever.aembed_query(user_prompt)
+    cached = classification_cache.get_semantic(query_embedding, version)
+    if cached is not None:
+        return cached, dict(CACHED_USAGE)
+    
+    # Routine tickets close to labelled KB rows are answered without an LLM call
+    result = retriever.fast_path.classify(query_embedding)
+    if result is not None:
+        classification_cache.put(user_prompt, query_embedding, result, version)
+        return result, dict(CACHED_USAGE)
+    
     logger.info("Retrieving knowledge base...")
-    knowledge_base = retrieve_knowledge(user_prompt)
+    knowledge_base = await retriever.aretrieve(user_prompt, query_embedding)
     logger.info(f"Knowledge base retrieved: {len(knowledge_base)} characters")
     
-    full_prompt = f"{user_prompt}\n\nRelevant Information:\n{knowledge_base}"
-    logger.info(f"Final prompt length: {len(full_prompt)} characters")
-    
-    # Try providers with fallback
-    try:
-        raw, usage = hugging_face.infer(system_prompt, full_prompt)
-        provider = "hugging_face"
-        logger.info("Groq response received, processing...")
-    except LLMProviderError as e:
-        logger.warning(f"Hugging Face failed, falling back to Together: {e}")
-        raw, usage = gemini.infer(system_prompt, full_prompt)
-        provider = "gemini"
-        logger.info("Gemini response received, processing...")
+    return await aclassify(system_prompt, user_prompt, knowledge_base, query_embedding, version)
+
+async def ainfer_batch(system_prompt: str, user_prompts: List[str], retriever: KnowledgeRetriever | None = None, concurrency: int = BATCH_LLM_CONCURRENCY):
+    logger.info(f"Starting async batch inference for {len(user_prompts)} conversations...")
     
-    logger.info(f"Raw {provider} output: {raw}")
+    retriever = retriever or get_retriever()
+    version = cache_version(system_prompt, retriever.revision)
+    results: List[Tuple[TaxonomyOutput, dict] | Exception | None] = [None] * len(user_prompts)
     
-    # Process response with validation and repair
-    try:
-        if not raw:
-            raise ValueError(f"Empty response from {provider}")
-        
-        logger.info("Parsing JSON response...")
-        extracted_json = extract_json(raw)
-        logger.info("JSON extraction successful")
-        logger.info("Validating output structure...")
-        result = validate_output(extracted_json)
-        logger.info(f"Inference completed successfully using {provider}")
-        return result, usage
+    pending = []
+    duplicates = {}
+    first_seen = {}
+    for i, user_prompt in enumerate(user_prompts):
+        # Repeated conversations within one batch are classified once
+        key = normalize_conversation(user_prompt)
+        if key in first_seen:
+            duplicates[i] = first_seen[key]
+            continue
+        first_seen[key] = i
         
-    except Exception as e:
-        logger.error(f"{provider} inference failed: {e}")
+        cached = classification_cache.get_exact(user_prompt, version)
+        if cached is not None:
+            results[i] = (cached, dict(CACHED_USAGE))
+        else:
+            pending.append(i)
+    
+    embeddings = await retriever.aembed_queries([user_prompts[i] for i in pending]) if pending else []
+    query_embeddings = {}
+    for i, query_embedding in zip(pending, embeddings):
+        cached = classification_cache.get_semantic(query_embedding, version)
+        if cached is None:
+            cached = retriever.fast_path.classify(query_embedding)
+            if cached is not None:
+                classification_cache.put(user_prompts[i], query_embedding, cached, version)
+        if cached is not None:
+            results[i] = (cached, dict(CACHED_USAGE))
+        else:
+            query_embeddings[i] = query_embedding
+    
+    pending = list(query_embeddings)
+    logger.info(f"{len(user_prompts) - len(pending)} cached or fast-path, {len(pending)} to classify")
+    knowledge_bases = await retriever.aretrieve_batch([query_embeddings[i] for i in pending])
+    
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def classify_item(i: int, knowledge_base: str):
+        async with semaphore:
+            try:
+                results[i] = await aclassify(system_prompt, user_prompts[i], knowledge_base, query_embeddings[i], version)
+            except Exception as e:
+                logger.error(f"Batch item {i} failed: {e}")
+                results[i] = e
+    
+    await asyncio.gather(*(classify_item(i, knowledge_base) for i, knowledge_base in zip(pending, knowledge_bases)))
+    
+    for i, first in duplicates.items():
+        results[i] = results[first]
+    
+    logger.info("Batch inference completed")
+    return results
+
+async def aclassify(system_prompt: str, user_prompt: str, knowledge_base: str, query_embedding: np.ndarray | None, version: str):
+    full_prompt = build_full_prompt(user_prompt, knowledge_base)
+    
+    result, raw, usage, provider = await provider_router.route(system_prompt, full_prompt, aprocess_output)
+    
+    if result is None:
+        if is_constrained(provider):
+            raise ValueError(f"{provider} returned invalid output despite constrained decoding: {raw}")
         logger.error("Falling back to repair prompt")
-        fallback_content = raw if raw else str(e)
-        content = repair_output_prompt(fallback_content, provider)
-        
-    logger.info("Final validation attempt...")
-    extracted_json = extract_json(content)
-    logger.info("JSON extraction successful")
-    logger.info("Validating output structure...")
-    result = validate_output(extracted_json)
-    logger.info("Inference completed successfully after repair")
+        content, repair_usage = await arepair_output_prompt(raw, provider)
+        usage = merge_usage(usage, repair_usage)
+        result = await avalidate_repaired_output(content)
     
+    log_prompt_usage(usage)
+    classification_cache.put(user_prompt, query_embedding, result, version)
     return result, usage
 
-def extract_json(raw: str) -> dict:
-    match = re.search(r"\{[\s\S]*?\}", raw)
-    if not match:
-        raise ValueError("No JSON object found")
-    return json.loads(match.group())
+def merge_usage(usage: dict, extra: dict) -> dict:
+    return {key: usage.get(key, 0) + extra.get(key, 0) for key in usage.keys() | extra.keys()}
+
+def log_prompt_usage(usage: dict):
+    # The system prompt is a byte-stable prefix, so cached_prompt_tokens shows provider prefix cache hits
+    logger.info(
+        f"Prompt tokens: {usage.get('prompt_tokens', 0)} "
+        f"({usage.get('cached_prompt_tokens', 0)} cached), completion tokens: {usage.get('completion_tokens', 0)}"
+    )
 
-def repair_output_prompt(raw: str, provider: str) -> str:
-    logger.info(f"Starting repair prompt process using {provider}...")
-    repair_system_prompt = repair_prompt + f"\n\n {raw}\n\nCorrected JSON:"
-    logger.info(f"Sending repair prompt to {provider}...")
+def build_full_prompt(user_prompt: str, knowledge_base: str) -> str:
+    # Few-shot examples first, then the conversation in the same CONVERSATION/JSON shape
+    full_prompt = (
+        f"Labelled examples of similar conversations:\n\n{knowledge_base}\n\n"
+        f"Classify this conversation:\nCONVERSATION:\n{json.dumps(user_prompt, ensure_ascii=False)}\nJSON:"
+    )
+    logger.info(f"Final prompt length: {len(full_prompt)} characters")
+    return full_prompt
+
+async def aprocess_output(raw: str, provider: str) -> TaxonomyOutput:
+    logger.info(f"Raw {provider} output: {raw}")
     
-    # Use the same provider for repair
-    try:
-        if provider == "gemini":
-            repair_content, _ = gemini.infer(repair_system_prompt, "")
-        else:
-            repair_content, _ = hugging_face.infer(repair_system_prompt, "")
-    except LLMProviderError:
-        # If repair fails, try the other provider
-        logger.warning(f"Repair failed on {provider}, trying alternate provider")
-        if provider == "gemini":
-            repair_content, _ = hugging_face.infer(repair_system_prompt, "")
-        else:
-            repair_content, _ = gemini.infer(repair_system_prompt, "")
+    if not raw:
+        raise ValueError(f"Empty response from {provider}")
+    
+    result = await avalidate_output(extract_json(raw))
+    logger.info(f"Inference completed successfully using {provider}")
+    return result
+
+async def avalidate_repaired_output(content: str) -> TaxonomyOutput:
+    logger.info("Final validation attempt...")
+    result = await avalidate_output(extract_json(content))
+    logger.info("Inference completed successfully after repair")
+    return result
+
+def extract_json(raw: str) -> dict:
+    # Brace-balanced and string-aware, so nested objects and "}" inside labels don't cut it short
+    return extract_json_object(raw)
+
+def is_constrained(provider: str) -> bool:
+    # Grammar-constrained output that still fails validation would not be fixed by a repair call
+    return getattr(providers.get(provider), "constrained_output", False)
+
+def repair_order(provider: str) -> List[str]:
+    # Repair on the provider that produced the output first, then the rest in routing order
+    return [provider] + [name for name in provider_router.ordered_providers() if name != provider]
+
+async def arepair_output_prompt(raw: str, provider: str) -> Tuple[str, dict]:
+    logger.info(f"Starting async repair prompt process using {provider}...")
+    last_error = None
+    for name in repair_order(provider):
+        logger.info(f"Sending repair prompt to {name}...")
+        try:
+            repair_content, usage = await provider_router.call(name, repair_prompt, build_repair_user_prompt(raw))
+            break
+        except LLMProviderError as e:
+            logger.warning(f"Repair failed on {name}, trying alternate provider")
+            last_error = e
+    else:
+        raise last_error
     
     logger.info(f"Raw repair output: {repair_content}")
-    return repair_content or "{}"
+    return repair_content or "{}", usage
 
-def validate_output(output: dict):
+async def avalidate_output(output: dict):
     logger.info("Starting output validation...")
-    logger.info(f"Output keys: {list(output.keys())}")
     
     try:
         validated = TaxonomyOutput.model_validate(output)
@@ -108,4 +213,19 @@ def validate_output(output: dict):
         return validated
     except ValidationError as e:
         logger.error(f"Output validation failed: {e}")
-        raise ValueError(f"Invalid taxonomy output: {e}")
\ No newline at end of file
+        # The resolver may embed unseen labels, which must stay off the event loop
+        return await run_in_embedding_pool(resolve_output, output, e)
+
+def resolve_output(output: dict, error: ValidationError) -> TaxonomyOutput:
+    # Near-miss labels are fixed locally instead of costing a repair call
+    resolved = label_resolver.resolve(output)
+    if resolved is None:
+        raise ValueError(f"Invalid taxonomy output: {error}")
+    (primary, secondary, tertiary), _ = resolved
+    confidence = output.get("confidence")
+    return TaxonomyOutput(
+        primary_topic=primary,
+        secondary_topic=secondary,
+        tertiary_topic=tertiary,
+        confidence=confidence if isinstance(confidence, (int, float)) and not isinstance(confidence, bool) else 0.0,
+    )
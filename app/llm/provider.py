@@ -1,2 +1,45 @@
+from email.utils import parsedate_to_datetime
+import time
+
+
 class LLMProviderError(Exception):
-    pass
\ No newline at end of file
+    def __init__(self, message: str = "", status_code: int | None = None, retry_after: float | None = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def is_overload(self) -> bool:
+        # Rate limiting and server-side failures mean the provider wants less traffic
+        return self.status_code is not None and (self.status_code == 429 or self.status_code >= 500)
+
+
+def retry_after_seconds(headers) -> float | None:
+    value = headers.get("retry-after") if headers else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_tokens(text: str) -> int:
+    # Providers tokenize differently; ~4 characters per token is close enough for budgeting
+    return len(text) // 4 + 1
+
+
+def estimated_usage(system_prompt: str, user_prompt: str, content: str) -> dict:
+    # A stream closed early never receives the provider's final usage event
+    prompt_tokens = estimate_tokens(system_prompt) + estimate_tokens(user_prompt)
+    completion_tokens = estimate_tokens(content)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "cached_prompt_tokens": 0,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
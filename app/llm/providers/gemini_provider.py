@@ -1,6 +1,7 @@
-import requests
-from app.constants import GEMINI_API_KEY, GEMINI_MODEL
-from app.llm.provider import LLMProviderError
+from app.constants import GEMINI_API_KEY, GEMINI_MODEL, PROVIDER_STREAMING
+from app.llm.json_stream import IncrementalJSONExtractor
+from app.llm.provider import LLMProviderError, estimated_usage, retry_after_seconds
+from app.llm.transport import get_async_http_client, iter_sse_json
 
 
 class GeminiProvider:
@@ -12,49 +13,94 @@ class GeminiProvider:
         self.base_url = (
             f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent"
         )
+        self.stream_url = (
+            f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:streamGenerateContent?alt=sse"
+        )
+        # Sent as a header so the key stays out of URLs and access logs
+        self.headers = {"Content-Type": "application/json", "x-goog-api-key": self.api_key}
 
-    def infer(self, system_prompt: str, user_prompt: str):
-        payload = {
+    def _build_payload(self, system_prompt: str, user_prompt: str):
+        return {
             "system_instruction": {"parts": [{"text": system_prompt}]},
             "contents": [{"role": "user", "parts": [{"text": user_prompt}]}],
             "generation_config": {"temperature": 0.1, "max_output_tokens": 100},
         }
 
-        try:
-            response = requests.post(
-                f"{self.base_url}?key={self.api_key}",
-                headers={"Content-Type": "application/json"},
-                json=payload,
-                timeout=30,
+    def _raise_for_status(self, response, data):
+        if response.status_code != 200:
+            raise LLMProviderError(
+                f"Gemini API error: {response.status_code} {data if data is not None else response.text}",
+                status_code=response.status_code,
+                retry_after=retry_after_seconds(response.headers),
             )
 
+    def _parse_usage(self, usage_metadata):
+        return {
+            "prompt_tokens": usage_metadata.get("promptTokenCount", 0),
+            "cached_prompt_tokens": usage_metadata.get("cachedContentTokenCount", 0),
+            "completion_tokens": usage_metadata.get("candidatesTokenCount", 0),
+            "total_tokens": usage_metadata.get("totalTokenCount", 0),
+        }
+
+    def _parse_response(self, response):
+        try:
+            data = response.json()
+        except Exception:
+            data = None
+
+        self._raise_for_status(response, data)
+
+        candidates = data.get("candidates", [])
+        if not candidates:
+            raise LLMProviderError("Gemini API returned no candidates")
+
+        parts = candidates[0].get("content", {}).get("parts", [])
+        if not parts or "text" not in parts[0]:
+            raise LLMProviderError("Gemini API response missing text content")
+
+        content = parts[0]["text"]
+        return content, self._parse_usage(data.get("usageMetadata", {}))
+
+    async def _astream(self, system_prompt: str, user_prompt: str):
+        extractor = IncrementalJSONExtractor()
+        usage_metadata = None
+        async with get_async_http_client("gemini").stream(
+            "POST", self.stream_url, headers=self.headers, json=self._build_payload(system_prompt, user_prompt)
+        ) as response:
             if response.status_code != 200:
+                await response.aread()
                 try:
-                    error_detail = response.json()
+                    data = response.json()
                 except Exception:
-                    error_detail = response.text
-                raise LLMProviderError(
-                    f"Gemini API error: {response.status_code} {error_detail}"
-                )
+                    data = None
+                self._raise_for_status(response, data)
+            async for event in iter_sse_json(response):
+                # Every chunk carries the running token counts
+                usage_metadata = event.get("usageMetadata") or usage_metadata
+                candidates = event.get("candidates", [])
+                for part in candidates[0].get("content", {}).get("parts", []) if candidates else []:
+                    extractor.feed(part.get("text", ""))
+                if extractor.result is not None:
+                    # Leaving the block closes the stream, which cancels the rest of the generation
+                    break
 
-            data = response.json()
-            candidates = data.get("candidates", [])
-            if not candidates:
-                raise LLMProviderError("Gemini API returned no candidates")
-
-            parts = candidates[0].get("content", {}).get("parts", [])
-            if not parts or "text" not in parts[0]:
-                raise LLMProviderError("Gemini API response missing text content")
-
-            content = parts[0]["text"]
-            usage_metadata = data.get("usageMetadata", {})
-            usage = {
-                "prompt_tokens": usage_metadata.get("promptTokenCount", 0),
-                "completion_tokens": usage_metadata.get("candidatesTokenCount", 0),
-                "total_tokens": usage_metadata.get("totalTokenCount", 0),
-            }
-
-            return content, usage
+        if not extractor.text:
+            raise LLMProviderError("Gemini API response missing text content")
+        if usage_metadata is None:
+            return extractor.text, estimated_usage(system_prompt, user_prompt, extractor.text)
+        return extractor.text, self._parse_usage(usage_metadata)
+
+    async def ainfer(self, system_prompt: str, user_prompt: str):
+        try:
+            if PROVIDER_STREAMING:
+                return await self._astream(system_prompt, user_prompt)
+
+            response = await get_async_http_client("gemini").post(
+                self.base_url,
+                headers=self.headers,
+                json=self._build_payload(system_prompt, user_prompt),
+            )
+            return self._parse_response(response)
 
         except LLMProviderError:
             raise
@@ -1,36 +1,50 @@
 import json
-from groq import Groq
+from groq import APIStatusError, AsyncGroq
 from app.constants import GROQ_API_KEY, GROQ_MODEL
-from app.llm.provider import LLMProviderError
+from app.llm.provider import LLMProviderError, retry_after_seconds
+from app.llm.transport import get_async_http_client
 
 class GroqProvider:
     def __init__(self):
-        self.client = Groq(api_key=GROQ_API_KEY)
+        self.async_client = AsyncGroq(api_key=GROQ_API_KEY, http_client=get_async_http_client("groq"))
     
-    def infer(self, system_prompt: str, user_prompt: str):
-        try:
-            response = self.client.chat.completions.create(
-                model=GROQ_MODEL,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.1,
-                max_tokens=100,
-                response_format={"type": "json_object"}
-            )
-            
-            content = response.choices[0].message.content
-            if not content:
-                raise LLMProviderError("Empty response from Groq")
-                
-            usage = {
-                'prompt_tokens': response.usage.prompt_tokens,
-                'completion_tokens': response.usage.completion_tokens,
-                'total_tokens': response.usage.total_tokens
-            }
+    def _build_request(self, system_prompt: str, user_prompt: str):
+        return {
+            "model": GROQ_MODEL,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            "temperature": 0.1,
+            "max_tokens": 100,
+            "response_format": {"type": "json_object"}
+        }
+    
+    def _parse_response(self, response):
+        content = response.choices[0].message.content
+        if not content:
+            raise LLMProviderError("Empty response from Groq")
             
-            return content, usage
+        prompt_details = getattr(response.usage, 'prompt_tokens_details', None)
+        usage = {
+            'prompt_tokens': response.usage.prompt_tokens,
+            'cached_prompt_tokens': getattr(prompt_details, 'cached_tokens', None) or 0,
+            'completion_tokens': response.usage.completion_tokens,
+            'total_tokens': response.usage.total_tokens
+        }
+        
+        return content, usage
+    
+    async def ainfer(self, system_prompt: str, user_prompt: str):
+        try:
+            response = await self.async_client.chat.completions.create(**self._build_request(system_prompt, user_prompt))
+            return self._parse_response(response)
             
+        except APIStatusError as e:
+            raise LLMProviderError(
+                f"Groq API error: {e}",
+                status_code=e.status_code,
+                retry_after=retry_after_seconds(e.response.headers),
+            )
         except Exception as e:
-            raise LLMProviderError(f"Groq API error: {e}")
\ No newline at end of file
+            raise LLMProviderError(f"Groq API error: {e}")
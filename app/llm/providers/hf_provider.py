@@ -1,41 +1,97 @@
-import json
-from huggingface_hub import InferenceClient
-from app.constants import HF_API_KEY, HF_MODEL
-from app.llm.provider import LLMProviderError
+from app.constants import HF_API_KEY, HF_CHAT_COMPLETIONS_URL, HF_MODEL, PROVIDER_STREAMING
+from app.llm.json_stream import IncrementalJSONExtractor
+from app.llm.provider import LLMProviderError, estimated_usage, retry_after_seconds
+from app.llm.transport import get_async_http_client, iter_sse_json
 
 
 class HuggingFaceProvider:
+    # Talks to the OpenAI-compatible Inference Providers router directly so the
+    # request goes through the shared pooled transport
     def __init__(self):
         if not HF_API_KEY:
             raise LLMProviderError("HF_API_KEY not set")
 
-        self.client = InferenceClient(
-            model=HF_MODEL,
-            token=HF_API_KEY
-        )
+        self.headers = {"Authorization": f"Bearer {HF_API_KEY}"}
 
-    def infer(self, system_prompt: str, user_prompt: str):
-        try:
-            response = self.client.chat.completions.create(
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                temperature=0.1,
-                max_tokens=100,
+    def _build_payload(self, system_prompt: str, user_prompt: str):
+        return {
+            "model": HF_MODEL,
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            "temperature": 0.1,
+            "max_tokens": 100,
+        }
+
+    def _raise_for_status(self, response):
+        if response.status_code != 200:
+            raise LLMProviderError(
+                f"Hugging Face API error: {response.status_code} {response.text}",
+                status_code=response.status_code,
+                retry_after=retry_after_seconds(response.headers),
             )
 
-            content = response.choices[0].message.content
-            if not content:
-                raise LLMProviderError("Empty response from Hugging Face")
+    def _parse_usage(self, usage_data):
+        return {
+            "prompt_tokens": usage_data.get("prompt_tokens", 0),
+            "cached_prompt_tokens": (usage_data.get("prompt_tokens_details") or {}).get("cached_tokens", 0),
+            "completion_tokens": usage_data.get("completion_tokens", 0),
+            "total_tokens": usage_data.get("total_tokens", 0),
+        }
+
+    def _parse_response(self, response):
+        self._raise_for_status(response)
+
+        data = response.json()
+        content = data["choices"][0]["message"]["content"]
+        if not content:
+            raise LLMProviderError("Empty response from Hugging Face")
+
+        return content, self._parse_usage(data.get("usage") or {})
 
-            usage = {
-                "prompt_tokens": getattr(response.usage, "prompt_tokens", 0),
-                "completion_tokens": getattr(response.usage, "completion_tokens", 0),
-                "total_tokens": getattr(response.usage, "total_tokens", 0),
-            }
+    async def _astream(self, system_prompt: str, user_prompt: str):
+        payload = {
+            **self._build_payload(system_prompt, user_prompt),
+            "stream": True,
+            "stream_options": {"include_usage": True},
+        }
+        extractor = IncrementalJSONExtractor()
+        usage_data = None
+        async with get_async_http_client("hugging_face").stream(
+            "POST", HF_CHAT_COMPLETIONS_URL, headers=self.headers, json=payload
+        ) as response:
+            if response.status_code != 200:
+                await response.aread()
+                self._raise_for_status(response)
+            async for event in iter_sse_json(response):
+                if event.get("usage"):
+                    usage_data = event["usage"]
+                for choice in event.get("choices") or []:
+                    extractor.feed((choice.get("delta") or {}).get("content") or "")
+                if extractor.result is not None:
+                    # Leaving the block closes the stream, which cancels the rest of the generation
+                    break
 
-            return content, usage
+        if not extractor.text:
+            raise LLMProviderError("Empty response from Hugging Face")
+        if usage_data is None:
+            return extractor.text, estimated_usage(system_prompt, user_prompt, extractor.text)
+        return extractor.text, self._parse_usage(usage_data)
+
+    async def ainfer(self, system_prompt: str, user_prompt: str):
+        try:
+            if PROVIDER_STREAMING:
+                return await self._astream(system_prompt, user_prompt)
+
+            response = await get_async_http_client("hugging_face").post(
+                HF_CHAT_COMPLETIONS_URL,
+                headers=self.headers,
+                json=self._build_payload(system_prompt, user_prompt),
+            )
+            return self._parse_response(response)
 
+        except LLMProviderError:
+            raise
         except Exception as e:
-            raise LLMProviderError(f"Hugging Face API error: {e}")
\ No newline at end of file
+            raise LLMProviderError(f"Hugging Face API error: {e}")
@@ -0,0 +1,187 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.constants import (
+    CLASSIFICATION_MODE,
+    LIKELIHOOD_TEMPERATURE,
+    LLAMA_CHAT_FORMAT,
+    LLAMA_MAX_TOKENS,
+    LLAMA_MODEL_PATH,
+    LLAMA_N_BATCH,
+    LLAMA_N_CTX,
+    LLAMA_N_GPU_LAYERS,
+    LLAMA_N_THREADS,
+)
+from app.llm.grammar import build_taxonomy_grammar
+from app.llm.likelihood import PathScorer
+from app.llm.provider import LLMProviderError
+from app.taxonomy.index import TAXONOMY_INDEX
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+CLASSIFICATION_MODES = ("generate", "likelihood")
+
+_models = {}
+_model_locks = {}
+_models_lock = threading.Lock()
+
+def load_llama_model(model_path: str = LLAMA_MODEL_PATH):
+    # Loading a GGUF maps several GB, so each path is loaded once per process.
+    # Returns the model and the lock that serialises use of its single llama.cpp context.
+    if model_path not in _models:
+        with _models_lock:
+            if model_path not in _models:
+                try:
+                    from llama_cpp import Llama
+                except ImportError:
+                    raise LLMProviderError("llama-cpp-python is not installed")
+
+                if not os.path.exists(model_path):
+                    raise LLMProviderError(f"LLAMA_MODEL_PATH does not exist: {model_path}")
+
+                logger.info(f"Loading llama.cpp model: {model_path}")
+                # The lock is published first: readers check _models without holding _models_lock
+                _model_locks[model_path] = threading.Lock()
+                _models[model_path] = Llama(
+                    model_path=model_path,
+                    n_ctx=LLAMA_N_CTX,
+                    n_threads=LLAMA_N_THREADS or None,
+                    n_batch=LLAMA_N_BATCH,
+                    n_gpu_layers=LLAMA_N_GPU_LAYERS,
+                    chat_format=LLAMA_CHAT_FORMAT,
+                    verbose=False,
+                )
+    return _models[model_path], _model_locks[model_path]
+
+
+class LlamaCppProvider:
+    # Decoding is constrained to valid taxonomy JSON, so output never needs the repair prompt
+    constrained_output = True
+
+    def __init__(self):
+        if not LLAMA_MODEL_PATH:
+            raise LLMProviderError("LLAMA_MODEL_PATH not set")
+        if CLASSIFICATION_MODE not in CLASSIFICATION_MODES:
+            raise ValueError(f"Unknown classification mode: {CLASSIFICATION_MODE}")
+
+        self.model, self._lock = load_llama_model(LLAMA_MODEL_PATH)
+        from llama_cpp import LlamaGrammar
+        self.grammar = LlamaGrammar.from_string(build_taxonomy_grammar(TAXONOMY_INDEX), verbose=False)
+        self.mode = CLASSIFICATION_MODE
+        # Built in both modes: evaluate_model.py fits the likelihood temperature through it
+        self.scorer = PathScorer(self.model, list(TAXONOMY_INDEX.paths), LIKELIHOOD_TEMPERATURE)
+        self.chat_formatter = self._load_chat_formatter()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llama_cpp")
+
+    def _build_request(self, system_prompt: str, user_prompt: str):
+        return {
+            "messages": [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            "temperature": 0.1,
+            "max_tokens": LLAMA_MAX_TOKENS,
+            "grammar": self.grammar,
+        }
+
+    def _parse_response(self, response):
+        choice = response["choices"][0]
+        content = choice["message"]["content"]
+        if not content:
+            raise LLMProviderError("Empty response from llama.cpp")
+        if choice.get("finish_reason") == "length":
+            # The grammar only guarantees valid JSON once decoding reaches the closing brace
+            raise LLMProviderError(f"llama.cpp output truncated at {LLAMA_MAX_TOKENS} tokens")
+
+        usage_data = response.get("usage") or {}
+        usage = {
+            "prompt_tokens": usage_data.get("prompt_tokens", 0),
+            "cached_prompt_tokens": 0,
+            "completion_tokens": usage_data.get("completion_tokens", 0),
+            "total_tokens": usage_data.get("total_tokens", 0),
+        }
+
+        return content, usage
+
+    def _load_chat_formatter(self):
+        # Scoring builds the prompt itself, so it renders the GGUF chat template that
+        # create_chat_completion would use; instruct models are only tuned on that format
+        template = self.model.metadata.get("tokenizer.chat_template")
+        if not template:
+            logger.warning("GGUF has no chat template; likelihood prompts are scored as plain text")
+            return None
+        if LLAMA_CHAT_FORMAT:
+            logger.warning(f"Likelihood scoring uses the GGUF chat template, not LLAMA_CHAT_FORMAT={LLAMA_CHAT_FORMAT}")
+
+        from llama_cpp.llama_chat_format import Jinja2ChatFormatter
+
+        def token_text(token: int) -> str:
+            return self.model.detokenize([token], special=True).decode("utf-8", errors="ignore") if token != -1 else ""
+
+        return Jinja2ChatFormatter(
+            template=template,
+            eos_token=token_text(self.model.token_eos()),
+            bos_token=token_text(self.model.token_bos()),
+            add_generation_prompt=True,
+        )
+
+    def _build_scoring_prompt(self, system_prompt: str, user_prompt: str) -> str:
+        # Label paths are scored as continuations of the opening brace of the assistant turn
+        if self.chat_formatter is None:
+            return f"{system_prompt}\n\n{user_prompt}\n{{"
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ]
+        return self.chat_formatter(messages=messages).prompt + "{"
+
+    def path_log_likelihoods(self, system_prompt: str, user_prompt: str):
+        prompt = self._build_scoring_prompt(system_prompt, user_prompt)
+        with self._lock:
+            log_likelihoods, _, _ = self.scorer.log_likelihoods(prompt, chat_template=self.chat_formatter is not None)
+        return log_likelihoods
+
+    def score(self, system_prompt: str, user_prompt: str):
+        prompt = self._build_scoring_prompt(system_prompt, user_prompt)
+        with self._lock:
+            ranked, prompt_tokens, cached_tokens = self.scorer.score(prompt, chat_template=self.chat_formatter is not None)
+
+        (primary, secondary, tertiary), probability = ranked[0]
+        content = json.dumps({
+            "primary_topic": primary,
+            "secondary_topic": secondary,
+            "tertiary_topic": tertiary,
+            "confidence": round(probability, 4),
+        })
+        # Nothing is generated; every label token was scored against the prompt instead
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "cached_prompt_tokens": cached_tokens,
+            "completion_tokens": 0,
+            "total_tokens": prompt_tokens,
+        }
+        return content, usage
+
+    def _infer(self, system_prompt: str, user_prompt: str):
+        try:
+            if self.mode == "likelihood":
+                return self.score(system_prompt, user_prompt)
+
+            with self._lock:
+                response = self.model.create_chat_completion(**self._build_request(system_prompt, user_prompt))
+            return self._parse_response(response)
+
+        except LLMProviderError:
+            raise
+        except Exception as e:
+            raise LLMProviderError(f"llama.cpp error: {e}")
+
+    async def ainfer(self, system_prompt: str, user_prompt: str):
+        # Decoding is CPU-bound, so it runs off the event loop on the provider's own thread
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._infer, system_prompt, user_prompt)
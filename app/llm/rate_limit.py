@@ -0,0 +1,156 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Dict
+
+from app.constants import (
+    CONCURRENCY_BACKOFF_FACTOR,
+    CONCURRENCY_DEFAULT_RETRY_AFTER_SECONDS,
+    CONCURRENCY_LATENCY_TARGET_SECONDS,
+    PROVIDER_DEFAULT_MAX_CONCURRENCY,
+    PROVIDER_INITIAL_CONCURRENCY,
+    PROVIDER_MAX_CONCURRENCY,
+    PROVIDER_MIN_CONCURRENCY,
+    PROVIDER_REQUESTS_PER_MINUTE,
+)
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    def __init__(self, requests_per_minute: float, capacity: float | None = None):
+        self.rate = requests_per_minute / 60
+        # Allow up to one second worth of requests to burst
+        self.capacity = capacity or max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class AdaptiveConcurrencyLimiter:
+    # AIMD: each healthy call adds 1/limit slots (about one slot per full window of calls),
+    # a 429/5xx or an over-target latency multiplies the limit by backoff_factor.
+    # Retry-After pauses new calls to the provider until the cool-down has passed.
+    def __init__(
+        self,
+        name: str,
+        initial: int = PROVIDER_INITIAL_CONCURRENCY,
+        min_limit: int = PROVIDER_MIN_CONCURRENCY,
+        max_limit: int = PROVIDER_DEFAULT_MAX_CONCURRENCY,
+        backoff_factor: float = CONCURRENCY_BACKOFF_FACTOR,
+        latency_target: float = CONCURRENCY_LATENCY_TARGET_SECONDS,
+    ):
+        self.name = name
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(self.max_limit, max(self.min_limit, initial)))
+        self.backoff_factor = backoff_factor
+        self.latency_target = latency_target
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.backoffs = 0
+        self._waiters = deque()
+        # Calls started before the last backoff saw the old limit; their failures must not
+        # shrink it again, or one burst of 429s would collapse the limit to its minimum
+        self._last_backoff_at = 0.0
+
+    def _has_capacity(self) -> bool:
+        return self.in_flight < int(self.limit)
+
+    def _wake_waiters(self):
+        while self._waiters and self._has_capacity():
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                # Reserve the slot for the woken waiter so newcomers can't overtake it
+                self.in_flight += 1
+
+    async def acquire(self):
+        while True:
+            delay = self.blocked_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            if self._has_capacity() and not self._waiters:
+                self.in_flight += 1
+                return
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self.release()
+                else:
+                    self._waiters.remove(waiter)
+                raise
+            if time.monotonic() >= self.blocked_until:
+                return
+            # A Retry-After arrived while this caller was queued; give the slot back and wait it out
+            self.release()
+
+    def release(self):
+        self.in_flight = max(0, self.in_flight - 1)
+        self._wake_waiters()
+
+    def on_success(self, started_at: float, latency: float):
+        if latency > self.latency_target:
+            self._back_off(started_at, f"latency {latency:.2f}s over the {self.latency_target}s target")
+            return
+        self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self._wake_waiters()
+
+    def on_overload(self, started_at: float, status_code: int | None, retry_after: float | None = None):
+        if retry_after is None and status_code == 429:
+            retry_after = CONCURRENCY_DEFAULT_RETRY_AFTER_SECONDS
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+        self._back_off(started_at, f"status {status_code}, retry after {retry_after or 0:.1f}s")
+
+    def _back_off(self, started_at: float, reason: str):
+        self.backoffs += 1
+        if started_at < self._last_backoff_at:
+            return
+        self._last_backoff_at = time.monotonic()
+        self.limit = max(self.min_limit, self.limit * self.backoff_factor)
+        logger.warning(f"{self.name} concurrency limit reduced to {int(self.limit)} ({reason})")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "backoffs": self.backoffs,
+            "retry_after_seconds": round(max(0.0, self.blocked_until - time.monotonic()), 2),
+        }
+
+_token_buckets: Dict[str, TokenBucket] = {}
+_concurrency_limiters: Dict[str, AdaptiveConcurrencyLimiter] = {}
+
+def get_token_bucket(provider: str) -> TokenBucket:
+    if provider not in _token_buckets:
+        # Providers without a configured quota get an unlimited bucket
+        _token_buckets[provider] = TokenBucket(PROVIDER_REQUESTS_PER_MINUTE.get(provider, 0))
+    return _token_buckets[provider]
+
+def get_concurrency_limiter(provider: str) -> AdaptiveConcurrencyLimiter:
+    if provider not in _concurrency_limiters:
+        _concurrency_limiters[provider] = AdaptiveConcurrencyLimiter(
+            provider,
+            max_limit=PROVIDER_MAX_CONCURRENCY.get(provider, PROVIDER_DEFAULT_MAX_CONCURRENCY),
+        )
+    return _concurrency_limiters[provider]
@@ -0,0 +1,167 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+import numpy as np
+
+from app.constants import (
+    RESULT_CACHE_MAX_ENTRIES,
+    RESULT_CACHE_SEMANTIC_THRESHOLD,
+    RESULT_CACHE_TTL_SECONDS,
+    TAXONOMY_DATA,
+)
+from app.prompts.repair_prompt import repair_prompt
+from app.schemas.taxonomy_data import TaxonomyOutput
+from app.taxonomy.index import TAXONOMY_INDEX
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+CACHED_USAGE = {"prompt_tokens": 0, "cached_prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+
+def normalize_conversation(conversation: str) -> str:
+    return re.sub(r"\s+", " ", conversation).strip().lower()
+
+@lru_cache(maxsize=8)
+def cache_version(system_prompt: str, kb_revision: int = 0) -> str:
+    # Cached labels are only valid for the taxonomy, prompts and knowledge base that produced
+    # them; the KB contributes its revision counter rather than its contents
+    payload = json.dumps(TAXONOMY_DATA, sort_keys=True) + system_prompt + repair_prompt + str(kb_revision)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+class ClassificationCache:
+    def __init__(
+        self,
+        max_entries: int = RESULT_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = RESULT_CACHE_TTL_SECONDS,
+        semantic_threshold: float = RESULT_CACHE_SEMANTIC_THRESHOLD,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.semantic_threshold = semantic_threshold
+        self.version = None
+        self._entries: OrderedDict[str, Tuple[float, TaxonomyOutput]] = OrderedDict()
+        # Unit vectors live in a preallocated matrix updated in place: a put writes one row and
+        # an eviction zeroes its row and frees the slot, so lookups never re-stack the cache
+        self._matrix = None
+        self._slots: Dict[str, int] = {}
+        self._slot_keys: List[str | None] = []
+        self._free_slots: List[int] = []
+        self._lock = threading.Lock()
+        self.stats_counters = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    @property
+    def semantic_enabled(self) -> bool:
+        return self.semantic_threshold > 0
+
+    def _sync_version(self, version: str):
+        if self.version != version:
+            if self._entries:
+                logger.info(f"Taxonomy, prompts or knowledge base changed, invalidating {len(self._entries)} cached classifications")
+                self.stats_counters["invalidations"] += 1
+            self.version = version
+            self._entries.clear()
+            self._slots.clear()
+            self._slot_keys.clear()
+            self._free_slots.clear()
+
+    def _key(self, conversation: str) -> str:
+        return hashlib.sha256(normalize_conversation(conversation).encode("utf-8")).hexdigest()
+
+    def _remove(self, key: str):
+        self._entries.pop(key, None)
+        slot = self._slots.pop(key, None)
+        if slot is not None:
+            self._matrix[slot] = 0.0
+            self._slot_keys[slot] = None
+            self._free_slots.append(slot)
+
+    def _store_vector(self, key: str, embedding: np.ndarray):
+        if self._matrix is None:
+            # put() inserts before evicting, so one row more than max_entries can be live
+            self._matrix = np.zeros((self.max_entries + 1, len(embedding)), dtype=np.float32)
+        if self._free_slots:
+            slot = self._free_slots.pop()
+        else:
+            slot = len(self._slot_keys)
+            self._slot_keys.append(None)
+        self._matrix[slot] = embedding / np.linalg.norm(embedding)
+        self._slot_keys[slot] = key
+        self._slots[key] = slot
+
+    def _hit(self, key: str, tier: str) -> TaxonomyOutput | None:
+        expires_at, output = self._entries[key]
+        if expires_at < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        self.stats_counters[f"{tier}_hits"] += 1
+        logger.info(f"Classification cache {tier} hit")
+        return output.model_copy()
+
+    def get_exact(self, conversation: str, version: str) -> TaxonomyOutput | None:
+        with self._lock:
+            self._sync_version(version)
+            key = self._key(conversation)
+            if key in self._entries:
+                output = self._hit(key, "exact")
+                if output is not None:
+                    return output
+            if not self.semantic_enabled:
+                self.stats_counters["misses"] += 1
+            return None
+
+    def get_semantic(self, embedding: np.ndarray, version: str) -> TaxonomyOutput | None:
+        if not self.semantic_enabled:
+            return None
+
+        with self._lock:
+            self._sync_version(version)
+            if self._slots:
+                # Freed rows are zero, so they never clear a positive threshold
+                query = (embedding / np.linalg.norm(embedding)).astype(np.float32)
+                similarities = self._matrix[: len(self._slot_keys)] @ query
+                best = int(np.argmax(similarities))
+                key = self._slot_keys[best]
+                if key is not None and similarities[best] >= self.semantic_threshold:
+                    output = self._hit(key, "semantic")
+                    if output is not None:
+                        return output
+
+            self.stats_counters["misses"] += 1
+            return None
+
+    def put(self, conversation: str, embedding: np.ndarray | None, output: TaxonomyOutput, version: str):
+        # An off-path answer is rejected by the API; caching it would replay the 400 for the
+        # TTL and spread it to near-duplicates through the semantic tier
+        if not TAXONOMY_INDEX.is_valid_path(output.primary_topic, output.secondary_topic, output.tertiary_topic):
+            logger.warning(f"Not caching invalid taxonomy path: {output}")
+            return
+        with self._lock:
+            self._sync_version(version)
+            key = self._key(conversation)
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, output.model_copy())
+            if self.semantic_enabled and embedding is not None:
+                self._store_vector(key, embedding)
+
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.stats_counters["evictions"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.stats_counters["exact_hits"] + self.stats_counters["semantic_hits"] + self.stats_counters["misses"]
+            hits = lookups - self.stats_counters["misses"]
+            return {
+                **self.stats_counters,
+                "size": len(self._entries),
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "version": self.version,
+            }
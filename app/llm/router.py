@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+from app.constants import HEDGE_DELAY_SECONDS, HEDGE_MIN_SAMPLES, PROVIDER_ROUTING_MODE
+from app.llm.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.llm.provider import LLMProviderError
+from app.llm.rate_limit import get_concurrency_limiter, get_token_bucket
+from app.schemas.taxonomy_data import TaxonomyOutput
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+ROUTING_MODES = ("sequential", "hedged", "race")
+
+class LatencyTracker:
+    def __init__(self, window: int = 100):
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, pct: float) -> float | None:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+class InvalidOutputError(ValueError):
+    def __init__(self, provider: str, raw: str, usage: dict, cause: Exception):
+        super().__init__(f"{provider} returned invalid output: {cause}")
+        self.provider = provider
+        self.raw = raw
+        self.usage = usage
+
+class ProviderRouter:
+    # sequential: call providers in order, moving on only when one errors (repair invalid output)
+    # hedged:     start the next provider once the current one exceeds its p95 latency budget
+    # race:       start every provider at once and keep the first valid TaxonomyOutput
+    def __init__(
+        self,
+        providers: Dict[str, Any],
+        order: List[str],
+        mode: str = PROVIDER_ROUTING_MODE,
+        hedge_delay: float = HEDGE_DELAY_SECONDS,
+    ):
+        if mode not in ROUTING_MODES:
+            raise ValueError(f"Unknown routing mode: {mode}")
+        self.providers = providers
+        self.order = [name for name in order if name in providers]
+        self.mode = mode
+        self.hedge_delay = hedge_delay
+        self.latencies = {name: LatencyTracker() for name in self.order}
+        self.breakers = {name: CircuitBreaker(name) for name in self.order}
+        logger.info(f"Provider router: mode={mode}, order={self.order}")
+
+    def hedge_budget(self, provider: str) -> float:
+        tracker = self.latencies[provider]
+        if len(tracker.samples) < HEDGE_MIN_SAMPLES:
+            return self.hedge_delay
+        return tracker.percentile(95)
+
+    def ordered_providers(self) -> List[str]:
+        # Healthiest first; ties keep the configured order
+        return sorted(self.order, key=lambda name: -self.breakers[name].health_score())
+
+    def health(self) -> Dict[str, Any]:
+        return {
+            name: {**self.breakers[name].snapshot(), "concurrency": get_concurrency_limiter(name).snapshot()}
+            for name in self.order
+        }
+
+    def _check_circuit(self, provider: str) -> CircuitBreaker:
+        breaker = self.breakers[provider]
+        if not breaker.allow_request():
+            raise CircuitOpenError(f"{provider} circuit is open")
+        return breaker
+
+    async def call(self, provider: str, system_prompt: str, user_prompt: str) -> Tuple[str, dict]:
+        breaker = self._check_circuit(provider)
+        limiter = get_concurrency_limiter(provider)
+        try:
+            await get_token_bucket(provider).acquire()
+            await limiter.acquire()
+        except asyncio.CancelledError:
+            breaker.release_probe()
+            raise
+        try:
+            start_time = time.monotonic()
+            raw, usage = await self.providers[provider].ainfer(system_prompt, user_prompt)
+        except LLMProviderError as e:
+            breaker.record_failure()
+            if e.is_overload:
+                limiter.on_overload(start_time, e.status_code, e.retry_after)
+            raise
+        except asyncio.CancelledError:
+            breaker.release_probe()
+            raise
+        finally:
+            limiter.release()
+        latency = time.monotonic() - start_time
+        self.latencies[provider].record(latency)
+        breaker.record_success(latency)
+        limiter.on_success(start_time, latency)
+        logger.info(f"{provider} response received, processing...")
+        return raw, usage
+
+    async def _attempt(self, provider: str, system_prompt: str, user_prompt: str, parse: Callable[[str, str], Awaitable[TaxonomyOutput]]):
+        raw, usage = await self.call(provider, system_prompt, user_prompt)
+        try:
+            return await parse(raw, provider), raw, usage, provider
+        except Exception as e:
+            raise InvalidOutputError(provider, raw, usage, e)
+
+    async def route(self, system_prompt: str, user_prompt: str, parse: Callable[[str, str], Awaitable[TaxonomyOutput]]):
+        # Returns (result, raw, usage, provider); result is None when only invalid output
+        # was produced and the caller should fall back to the repair prompt
+        if self.mode == "sequential":
+            return await self._route_sequential(system_prompt, user_prompt, parse)
+        return await self._route_staggered(system_prompt, user_prompt, parse)
+
+    async def _route_sequential(self, system_prompt, user_prompt, parse):
+        last_error = None
+        for provider in self.ordered_providers():
+            try:
+                raw, usage = await self.call(provider, system_prompt, user_prompt)
+            except LLMProviderError as e:
+                logger.warning(f"{provider} failed, falling back to next provider: {e}")
+                last_error = e
+                continue
+            try:
+                return await parse(raw, provider), raw, usage, provider
+            except Exception as e:
+                logger.error(f"{provider} inference failed: {e}")
+                return None, raw if raw else str(e), usage, provider
+        raise last_error or LLMProviderError("No LLM providers configured")
+
+    async def _route_staggered(self, system_prompt, user_prompt, parse):
+        pending = self.ordered_providers()
+        running: Dict[asyncio.Task, str] = {}
+        invalid: List[InvalidOutputError] = []
+        last_error = None
+
+        def launch():
+            provider = pending.pop(0)
+            logger.info(f"Starting {self.mode} request to {provider}")
+            running[asyncio.ensure_future(self._attempt(provider, system_prompt, user_prompt, parse))] = provider
+            return provider
+
+        try:
+            current = launch()
+            while running:
+                timeout = None
+                if pending:
+                    timeout = 0 if self.mode == "race" else self.hedge_budget(current)
+
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    logger.info(f"{current} exceeded {timeout:.2f}s budget, hedging")
+                    current = launch()
+                    continue
+
+                for task in done:
+                    provider = running.pop(task)
+                    try:
+                        result, raw, usage, provider = task.result()
+                        logger.info(f"{provider} won the {self.mode} request")
+                        return result, raw, usage, provider
+                    except InvalidOutputError as e:
+                        logger.warning(str(e))
+                        invalid.append(e)
+                    except LLMProviderError as e:
+                        logger.warning(f"{provider} failed: {e}")
+                        last_error = e
+
+                # Every in-flight attempt failed; don't wait out the budget before trying the next one
+                if not running and pending:
+                    current = launch()
+        finally:
+            for task in running:
+                task.cancel()
+
+        if invalid:
+            return None, invalid[0].raw or str(invalid[0]), invalid[0].usage, invalid[0].provider
+        raise last_error or LLMProviderError("No LLM providers configured")
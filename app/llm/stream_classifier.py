@@ -0,0 +1,151 @@
+import asyncio
+import csv
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, Tuple
+
+from app.constants import STREAM_MAX_IN_FLIGHT, STREAM_MAX_RECORD_BYTES
+from app.llm.knowledge_base import KnowledgeRetriever
+from app.llm.llm_inference import ainfer
+from app.taxonomy.tree import TAXONOMY_TREE
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+class RecordTooLargeError(ValueError):
+    pass
+
+_END_OF_STREAM = object()
+
+async def iter_lines(chunks: AsyncIterator[bytes], max_line_bytes: int = STREAM_MAX_RECORD_BYTES) -> AsyncIterator[str]:
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8").rstrip("\r")
+        if len(buffer) > max_line_bytes:
+            raise RecordTooLargeError(f"Record exceeds {max_line_bytes} bytes")
+    if buffer:
+        yield buffer.decode("utf-8").rstrip("\r")
+
+async def iter_ndjson_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[Dict[str, Any]]:
+    async for line in iter_lines(chunks):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield {"error": f"Invalid JSON: {e}"}
+            continue
+        if not isinstance(record, dict):
+            yield {"error": "Each NDJSON line must be an object"}
+            continue
+        yield record
+
+async def iter_csv_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[Dict[str, Any]]:
+    header = None
+    pending = ""
+    async for line in iter_lines(chunks):
+        # Quoted fields may span lines; a record is complete once its quotes balance
+        pending = f"{pending}\n{line}" if pending else line
+        if pending.count('"') % 2:
+            if len(pending) > STREAM_MAX_RECORD_BYTES:
+                raise RecordTooLargeError(f"Record exceeds {STREAM_MAX_RECORD_BYTES} bytes")
+            continue
+
+        record_text, pending = pending, ""
+        if not record_text.strip():
+            continue
+        row = next(csv.reader([record_text]))
+        if header is None:
+            header = [column.lstrip("\ufeff").strip() for column in row]
+            continue
+        yield dict(zip(header, row))
+
+    if pending:
+        yield {"error": "Unterminated quoted field at end of input"}
+
+def _record_query(record: Dict[str, Any]) -> Tuple[Any, str | None]:
+    conversation_id = record.get("conversation_id")
+    query = record.get("user_query") or record.get("conversation")
+    return conversation_id, query if isinstance(query, str) and query.strip() else None
+
+async def stream_classifications(
+    system_prompt: str,
+    records: AsyncIterator[Dict[str, Any]],
+    retriever: KnowledgeRetriever,
+    max_in_flight: int = STREAM_MAX_IN_FLIGHT,
+) -> AsyncIterator[Dict[str, Any]]:
+    # Input is only pulled while fewer than max_in_flight classifications are running,
+    # so memory stays bounded however large the upload is
+    in_flight: Dict[asyncio.Task, Tuple[int, Any]] = {}
+
+    async def classify(query: str):
+        taxonomy_output, usage = await ainfer(system_prompt, query, retriever)
+        if not TAXONOMY_TREE.validate_path(taxonomy_output):
+            raise ValueError("Invalid taxonomy path")
+        return taxonomy_output, usage
+
+    def drain(done):
+        for task in done:
+            index, conversation_id = in_flight.pop(task)
+            line = {"index": index, "conversation_id": conversation_id}
+            try:
+                taxonomy_output, usage = task.result()
+                line.update(result=taxonomy_output.model_dump(), usage=usage)
+            except Exception as e:
+                line["error"] = str(e)
+            yield line
+
+    record_iterator = records.__aiter__()
+
+    async def read_record():
+        try:
+            return await record_iterator.__anext__()
+        except StopAsyncIteration:
+            return _END_OF_STREAM
+
+    next_record: asyncio.Task | None = None
+    exhausted = False
+    index = -1
+    try:
+        while not exhausted or in_flight:
+            # Race the next input record against running classifications so results
+            # are emitted as soon as they complete, even while the upload is stalled
+            if not exhausted and next_record is None and len(in_flight) < max_in_flight:
+                next_record = asyncio.ensure_future(read_record())
+
+            waiting = set(in_flight) | ({next_record} if next_record else set())
+            done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+
+            if next_record in done:
+                done.discard(next_record)
+                task, next_record = next_record, None
+                try:
+                    record = task.result()
+                except Exception as e:
+                    logger.error(f"Failed to read input stream: {e}")
+                    exhausted = True
+                    yield {"index": index + 1, "conversation_id": None, "error": f"Failed to read input: {e}"}
+                    record = _END_OF_STREAM
+
+                if record is _END_OF_STREAM:
+                    exhausted = True
+                else:
+                    index += 1
+                    conversation_id, query = _record_query(record)
+                    if "error" in record or query is None:
+                        yield {"index": index, "conversation_id": conversation_id, "error": record.get("error", "Missing user_query or conversation")}
+                    else:
+                        in_flight[asyncio.ensure_future(classify(query))] = (index, conversation_id)
+
+            for line in drain(done):
+                yield line
+
+        logger.info(f"Stream classification completed: {index + 1} records")
+    finally:
+        for task in in_flight:
+            task.cancel()
+        if next_record is not None:
+            next_record.cancel()
@@ -0,0 +1,115 @@
+import json
+import logging
+import threading
+from typing import Any, AsyncIterator, Dict
+import httpx
+
+from app.constants import (
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_KEEPALIVE_EXPIRY,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    HTTP_READ_TIMEOUT,
+    PROVIDER_MAX_CONNECTIONS,
+)
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+class TransportMetrics:
+    # A request that completes without a connect_tcp event reused a pooled connection
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self.tls_handshakes = 0
+        self._lock = threading.Lock()
+
+    def record_event(self, event_name: str):
+        with self._lock:
+            if event_name == "connection.connect_tcp.complete":
+                self.new_connections += 1
+            elif event_name == "connection.start_tls.complete":
+                self.tls_handshakes += 1
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            reused = max(0, self.requests - self.new_connections)
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "tls_handshakes": self.tls_handshakes,
+                "reused_connections": reused,
+                "reuse_rate": round(reused / self.requests, 4) if self.requests else 0.0,
+            }
+
+_metrics: Dict[str, TransportMetrics] = {}
+_async_clients: Dict[str, httpx.AsyncClient] = {}
+_clients_lock = threading.Lock()
+
+def _get_metrics(provider: str) -> TransportMetrics:
+    if provider not in _metrics:
+        _metrics[provider] = TransportMetrics()
+    return _metrics[provider]
+
+def _client_options(provider: str) -> Dict[str, Any]:
+    max_connections = PROVIDER_MAX_CONNECTIONS.get(provider, HTTP_MAX_CONNECTIONS)
+    return {
+        "http2": HTTP2_AVAILABLE,
+        "limits": httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=min(max_connections, HTTP_MAX_KEEPALIVE_CONNECTIONS),
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+    }
+
+def get_async_http_client(provider: str) -> httpx.AsyncClient:
+    with _clients_lock:
+        if provider not in _async_clients:
+            metrics = _get_metrics(provider)
+
+            async def trace(event_name: str, info: dict):
+                metrics.record_event(event_name)
+
+            async def on_request(request: httpx.Request):
+                request.extensions["trace"] = trace
+
+            async def on_response(response: httpx.Response):
+                metrics.record_request()
+
+            logger.info(f"Creating pooled async HTTP client for {provider} (http2: {HTTP2_AVAILABLE})")
+            _async_clients[provider] = httpx.AsyncClient(
+                event_hooks={"request": [on_request], "response": [on_response]},
+                **_client_options(provider),
+            )
+        return _async_clients[provider]
+
+async def close_http_clients():
+    with _clients_lock:
+        async_clients = list(_async_clients.values())
+        _async_clients.clear()
+    for client in async_clients:
+        await client.aclose()
+
+async def iter_sse_json(response: httpx.Response) -> AsyncIterator[Dict[str, Any]]:
+    # Server-sent events as emitted by OpenAI-compatible and Gemini streaming endpoints
+    async for line in response.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+        data = line[len("data:"):].strip()
+        if not data or data == "[DONE]":
+            continue
+        yield json.loads(data)
+
+def transport_metrics() -> Dict[str, Dict[str, Any]]:
+    return {provider: metrics.snapshot() for provider, metrics in _metrics.items()}
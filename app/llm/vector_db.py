@@ -1,14 +1,59 @@
 import numpy as np
 import logging
+import threading
+from contextlib import nullcontext
 from qdrant_client import QdrantClient
-from qdrant_client.models import PointStruct, VectorParams, Distance
+from qdrant_client.models import PointIdsList, PointStruct, QueryRequest, VectorParams, Distance
 from typing import List, Dict, Any
 
+from app.constants import QDRANT_API_KEY, QDRANT_GRPC_PORT, QDRANT_MODE, QDRANT_PATH, QDRANT_PREFER_GRPC, QDRANT_URL
+from app.llm.embeddings import EMBEDDING_MODEL, content_hash
+
 # Set up logging
 logger = logging.getLogger(__name__)
 
+QDRANT_MODES = ("memory", "path", "server")
+
+def create_qdrant_client(mode: str = QDRANT_MODE) -> QdrantClient:
+    if mode not in QDRANT_MODES:
+        raise ValueError(f"Unknown Qdrant mode: {mode}")
+    if mode == "server":
+        logger.info(f"Connecting to Qdrant at {QDRANT_URL} (gRPC: {QDRANT_PREFER_GRPC})")
+        return QdrantClient(
+            url=QDRANT_URL, api_key=QDRANT_API_KEY, prefer_grpc=QDRANT_PREFER_GRPC, grpc_port=QDRANT_GRPC_PORT
+        )
+    if mode == "path":
+        logger.info(f"Opening embedded Qdrant storage at {QDRANT_PATH}")
+        return QdrantClient(path=QDRANT_PATH)
+    return QdrantClient(":memory:")
+
+def _is_current(point, conv: Dict[str, Any]) -> bool:
+    payload = point.payload or {}
+    return payload.get("content_hash") == content_hash(conv) and payload.get("embedding_model") == EMBEDDING_MODEL
+
+def load_stored_embeddings(client: QdrantClient, collection_name: str, conversations: List[Dict[str, Any]]) -> int:
+    # A persistent index already holds vectors for unchanged rows; reusing them means a
+    # restart (or another replica) does no embedding work at all
+    if not conversations or not client.collection_exists(collection_name):
+        return 0
+    by_id = {conv['id']: conv for conv in conversations}
+    points = client.retrieve(
+        collection_name=collection_name,
+        ids=list(by_id),
+        with_payload=["content_hash", "embedding_model"],
+        with_vectors=True
+    )
+    reused = 0
+    for point in points:
+        conv = by_id.get(point.id)
+        if conv is not None and point.vector is not None and _is_current(point, conv):
+            conv['embedding'] = np.asarray(point.vector, dtype=np.float32)
+            reused += 1
+    logger.info(f"Reused {reused}/{len(conversations)} stored vectors from collection {collection_name}")
+    return reused
+
 class VectorDB:
-    def __init__(self, client: QdrantClient, collection_name: str, conversations: List[Dict[str, Any]]):
+    def __init__(self, client: QdrantClient, collection_name: str, conversations: List[Dict[str, Any]], local: bool = False):
         logger.info(f"Initializing VectorDB with collection: {collection_name}")
         logger.info(f"Processing {len(conversations)} conversations")
         
@@ -16,6 +61,9 @@ class VectorDB:
         self.collection_name = collection_name
         self.conversations = conversations
         self.embedding_dim = len(conversations[0]['embedding']) if conversations else 0
+        # The embedded (local) Qdrant mutates plain Python/numpy structures, so searches must
+        # not interleave with hot-reload writes; a Qdrant server handles that itself
+        self._lock = threading.Lock() if local else nullcontext()
         
         logger.info(f"Embedding dimension: {self.embedding_dim}")
         
@@ -27,53 +75,107 @@ class VectorDB:
     def _create_collection(self):
         logger.info(f"Creating collection: {self.collection_name}")
         
-        try:
-            self.client.get_collection(self.collection_name)
+        if self.client.collection_exists(self.collection_name):
+            stored_dim = self.client.get_collection(self.collection_name).config.params.vectors.size
+            if self.embedding_dim and stored_dim != self.embedding_dim:
+                raise ValueError(
+                    f"Collection {self.collection_name} stores {stored_dim}-dim vectors but the embedder produces "
+                    f"{self.embedding_dim}; drop it or set QDRANT_COLLECTION"
+                )
             logger.info("Collection already exists")
-        except:
-            logger.info("Collection doesn't exist, creating new one...")
-            self.client.create_collection(
-                collection_name=self.collection_name,
-                vectors_config=VectorParams(size=self.embedding_dim, distance=Distance.COSINE)
-            )
-            logger.info("Collection created successfully")
+            return
 
-    def _insert_vectors(self):
-        logger.info(f"Inserting {len(self.conversations)} vectors into collection")
-        
-        points = []
-        for i, conv in enumerate(self.conversations):
-            point = PointStruct(
-                id=conv['id'],
-                vector=conv['embedding'].tolist(),
-                payload={
-                    "conversation_id": conv['id'],
-                    "conversation_text": conv['text'][:500],
-                    "source": "conversation_data"
-                }
-            )
-            points.append(point)
-            
-            if i % 50 == 0:  # Log progress every 50 points
-                logger.info(f"Prepared {i+1}/{len(self.conversations)} points")
-        
-        logger.info("Upserting points to Qdrant...")
-        self.client.upsert(
+        logger.info("Collection doesn't exist, creating new one...")
+        self.client.create_collection(
             collection_name=self.collection_name,
-            points=points
+            vectors_config=VectorParams(size=self.embedding_dim, distance=Distance.COSINE)
         )
+        logger.info("Collection created successfully")
+
+    def _insert_vectors(self):
+        # Points whose id, content hash and embedding model already match are not rewritten,
+        # and points for rows no longer in the knowledge base are removed
+        by_id = {conv['id']: conv for conv in self.conversations}
+        stored_ids = set()
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                limit=1024,
+                offset=offset,
+                with_payload=["content_hash", "embedding_model"],
+                with_vectors=False
+            )
+            stored_ids.update(point.id for point in points if point.id in by_id and _is_current(point, by_id[point.id]))
+            stale = [point.id for point in points if point.id not in by_id]
+            self.delete_conversations(stale)
+            if offset is None:
+                break
+
+        pending = [conv for conv in self.conversations if conv['id'] not in stored_ids]
+        logger.info(f"Inserting {len(pending)} vectors into collection ({len(stored_ids)} already stored)")
+        self.upsert_conversations(pending)
         logger.info("Vector insertion completed successfully")
 
+    def _to_point(self, conv: Dict[str, Any]) -> PointStruct:
+        return PointStruct(
+            id=conv['id'],
+            vector=conv['embedding'].tolist(),
+            payload={
+                "conversation_id": conv['id'],
+                "conversation_text": conv['text'],
+                "primary_topic": conv.get('primary_topic'),
+                "secondary_topic": conv.get('secondary_topic'),
+                "tertiary_topic": conv.get('tertiary_topic'),
+                "content_hash": content_hash(conv),
+                "embedding_model": EMBEDDING_MODEL,
+                "source": "conversation_data"
+            }
+        )
+
+    def upsert_conversations(self, conversations: List[Dict[str, Any]]):
+        if not conversations:
+            return
+        points = [self._to_point(conv) for conv in conversations]
+        logger.info(f"Upserting {len(points)} points to Qdrant...")
+        with self._lock:
+            self.client.upsert(collection_name=self.collection_name, points=points)
+
+    def delete_conversations(self, conversation_ids: List[int]):
+        if not conversation_ids:
+            return
+        logger.info(f"Deleting {len(conversation_ids)} points from Qdrant...")
+        with self._lock:
+            self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=PointIdsList(points=list(conversation_ids))
+            )
+
     def search_vectors(self, query_vector: np.ndarray, top_k: int = 5):
         logger.info(f"Searching for {top_k} similar vectors")
         logger.info(f"Query vector shape: {query_vector.shape}")
 
-        results = self.client.query_points(
-            collection_name=self.collection_name,
-            query=query_vector.tolist(),
-            limit=top_k,
-            with_payload=True
-        )
+        with self._lock:
+            results = self.client.query_points(
+                collection_name=self.collection_name,
+                query=query_vector.tolist(),
+                limit=top_k,
+                with_payload=True,
+                with_vectors=True
+            )
         
         logger.info(f"Found {len(results.points)} results")
-        return results.points
\ No newline at end of file
+        return results.points
+
+    def search_vectors_batch(self, query_vectors: List[np.ndarray], top_k: int = 5):
+        logger.info(f"Batch searching {len(query_vectors)} queries for {top_k} similar vectors each")
+
+        requests = [
+            QueryRequest(query=query_vector.tolist(), limit=top_k, with_payload=True, with_vector=True)
+            for query_vector in query_vectors
+        ]
+        with self._lock:
+            responses = self.client.query_batch_points(collection_name=self.collection_name, requests=requests)
+
+        logger.info(f"Batch search returned {len(responses)} result sets")
+        return [response.points for response in responses]
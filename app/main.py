@@ -1,28 +1,163 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import hmac
+import json
+import logging
+from contextlib import asynccontextmanager
 
-from app.llm.llm_inference import infer
-from app.schemas.taxonomy_data import QueryRequest
+from fastapi import FastAPI, HTTPException, Request
+from starlette.requests import ClientDisconnect
+from starlette.responses import StreamingResponse
+
+from app.constants import ADMIN_API_KEY, KB_WATCH_INTERVAL_SECONDS
+from app.llm.embeddings import knowledge_base_record, run_in_embedding_pool, warm_up_embedder
+from app.llm.knowledge_base import get_retriever, watch_knowledge_base
+from app.llm.llm_inference import ainfer, ainfer_batch, classification_cache, label_resolver, provider_router
+from app.llm.transport import close_http_clients, transport_metrics
+from app.llm.stream_classifier import iter_csv_records, iter_ndjson_records, stream_classifications
+from app.schemas.taxonomy_data import (
+    BatchItemResult,
+    BatchQueryRequest,
+    KnowledgeBaseDeleteRequest,
+    KnowledgeBaseUpsertRequest,
+    QueryRequest,
+)
 from app.prompts.system_prompt import system_prompt
-from app.taxonomy.tree import TaxonomyTree
-from app.constants import TAXONOMY_DATA
+from app.taxonomy.tree import TAXONOMY_TREE
+
+logger = logging.getLogger(__name__)
+
+DISCONNECT_POLL_SECONDS = 0.5
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_in_embedding_pool(warm_up_embedder)
+    await run_in_embedding_pool(label_resolver.warm_up)
+    # Embed the knowledge base and build the vector index once per process
+    app.state.retriever = await run_in_embedding_pool(get_retriever)
+    watcher = None
+    if KB_WATCH_INTERVAL_SECONDS > 0:
+        watcher = asyncio.create_task(watch_knowledge_base(app.state.retriever))
+    yield
+    if watcher is not None:
+        watcher.cancel()
+    await close_http_clients()
 
-app = FastAPI()
+async def run_until_disconnected(http_request: Request, coro):
+    # Stop paying for embedding and LLM calls once nobody is waiting for the answer
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                logger.warning("Client disconnected, cancelling inference")
+                task.cancel()
+                raise HTTPException(status_code=499, detail="Client disconnected")
+    finally:
+        if not task.done():
+            task.cancel()
+
+class DuplexStreamingResponse(StreamingResponse):
+    # The body generator keeps reading the request stream while results are sent,
+    # so the response must not consume receive() itself to watch for disconnects
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+
+        if self.background is not None:
+            await self.background()
+
+app = FastAPI(lifespan=lifespan)
 
 @app.get("/health")
-async def health_check():
-    return {"status": "healthy"}
+async def health_check(http_request: Request):
+    return {
+        "status": "healthy",
+        "providers": provider_router.health(),
+        "cache": classification_cache.stats(),
+        "fast_path": http_request.app.state.retriever.fast_path.stats(),
+        "knowledge_base": http_request.app.state.retriever.kb_stats(),
+        "label_resolver": label_resolver.stats(),
+        "transport": transport_metrics(),
+    }
 
 @app.post("/infer")
-async def infer_endpoint(request: QueryRequest):
+async def infer_endpoint(request: QueryRequest, http_request: Request):
     user_query = request.user_query
-    validated_output = infer(system_prompt, user_query)
+    validated_output = await run_until_disconnected(
+        http_request, ainfer(system_prompt, user_query, http_request.app.state.retriever)
+    )
     taxonomy_output = validated_output[0]
-    taxonomy_tree = TaxonomyTree(TAXONOMY_DATA)
-    if taxonomy_tree.validate_path(taxonomy_output):
+    if TAXONOMY_TREE.validate_path(taxonomy_output):
         return validated_output
     else:
         raise HTTPException(status_code=400, detail="Invalid taxonomy path")
 
+@app.post("/infer/batch", response_model=list[BatchItemResult])
+async def infer_batch_endpoint(request: BatchQueryRequest, http_request: Request):
+    user_queries = [query.user_query for query in request.queries]
+    outcomes = await run_until_disconnected(
+        http_request, ainfer_batch(system_prompt, user_queries, http_request.app.state.retriever)
+    )
+
+    results = []
+    for index, outcome in enumerate(outcomes):
+        if isinstance(outcome, Exception):
+            results.append(BatchItemResult(index=index, error=str(outcome)))
+        elif not TAXONOMY_TREE.validate_path(outcome[0]):
+            results.append(BatchItemResult(index=index, error="Invalid taxonomy path"))
+        else:
+            results.append(BatchItemResult(index=index, result=outcome[0], usage=outcome[1]))
+    return results
+
+@app.post("/infer/stream")
+async def infer_stream_endpoint(http_request: Request):
+    # Accepts NDJSON ({"user_query": ...} or {"conversation_id": ..., "conversation": ...}
+    # per line) or CSV with a header row; results are streamed back as NDJSON
+    content_type = http_request.headers.get("content-type", "")
+    parse_records = iter_csv_records if "csv" in content_type else iter_ndjson_records
+    records = parse_records(http_request.stream())
+
+    async def body():
+        async for line in stream_classifications(system_prompt, records, http_request.app.state.retriever):
+            yield json.dumps(line) + "\n"
+
+    return DuplexStreamingResponse(body(), media_type="application/x-ndjson")
+
+def require_admin(http_request: Request):
+    if not ADMIN_API_KEY:
+        raise HTTPException(status_code=403, detail="Admin API disabled")
+    # Bytes, because compare_digest raises TypeError on non-ASCII str
+    provided = http_request.headers.get("x-admin-key", "").encode("utf-8")
+    if not hmac.compare_digest(provided, ADMIN_API_KEY.encode("utf-8")):
+        raise HTTPException(status_code=401, detail="Invalid admin key")
+
+@app.put("/admin/knowledge-base/conversations")
+async def upsert_knowledge_base_endpoint(request: KnowledgeBaseUpsertRequest, http_request: Request):
+    # Live edit without a redeploy; a later edit of the same row in the source file wins again
+    require_admin(http_request)
+    retriever = http_request.app.state.retriever
+    conversations = [knowledge_base_record(record.model_dump()) for record in request.records]
+    upserted = await run_in_embedding_pool(retriever.upsert_conversations, conversations)
+    return {"upserted": upserted, **retriever.kb_stats()}
+
+@app.post("/admin/knowledge-base/conversations/delete")
+async def delete_knowledge_base_endpoint(request: KnowledgeBaseDeleteRequest, http_request: Request):
+    require_admin(http_request)
+    retriever = http_request.app.state.retriever
+    deleted = await run_in_embedding_pool(retriever.delete_conversations, request.conversation_ids)
+    return {"deleted": deleted, **retriever.kb_stats()}
+
+@app.post("/admin/knowledge-base/reload")
+async def reload_knowledge_base_endpoint(http_request: Request):
+    require_admin(http_request)
+    retriever = http_request.app.state.retriever
+    changes = await run_in_embedding_pool(retriever.reload_knowledge_base, True)
+    return {**(changes or {"upserted": 0, "deleted": 0}), **retriever.kb_stats()}
+
 """
 Primary:
 Account Management, Order Management, Product Issues, Returns & Exchanges, Billing & Payment,
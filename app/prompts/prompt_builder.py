@@ -0,0 +1,27 @@
+from typing import List
+
+from app.taxonomy.index import TaxonomyIndex
+
+def encode_taxonomy(index: TaxonomyIndex) -> str:
+    # One line per secondary topic, grouped under its primary:
+    #   Account Management
+    #   - Login Issues: Password Reset Requests | Account Reactivation
+    # Labels appear exactly once and in TAXONOMY_DATA order, so the encoding is byte-stable
+    lines: List[str] = []
+    for primary in index.primaries:
+        lines.append(primary)
+        for secondary in index.children[primary]:
+            lines.append(f"- {secondary}: {' | '.join(index.children[secondary])}")
+    return "\n".join(lines)
+
+def build_system_prompt(instructions: str, index: TaxonomyIndex) -> str:
+    # Everything that varies per request (conversation, retrieved context) belongs in the
+    # user message so this prefix stays identical and provider prefix caches can hit
+    return (
+        f"{instructions.strip()}\n\n"
+        "TAXONOMY (primary, then \"- secondary: tertiary | tertiary\"; use EXACT labels only):\n"
+        f"{encode_taxonomy(index)}\n"
+    )
+
+def build_repair_user_prompt(raw: str) -> str:
+    return f"Original output:\n{raw}\n\nCorrected JSON:"
@@ -1,4 +1,7 @@
-repair_prompt = """
+from app.prompts.prompt_builder import build_system_prompt
+from app.taxonomy.index import TAXONOMY_INDEX
+
+instructions = """
 You produced an INVALID classification.
 
 Fix it so that:
@@ -8,95 +11,7 @@ Fix it so that:
 - Use ONLY labels from the taxonomy
 - Do NOT add explanations or extra text
 - INCLUDE ALL FOUR KEYS EVEN IF NULL
+"""
 
-Customer Support Topics
-├── Account Management
-│   ├── Login Issues
-│   │   ├── Mobile/Email Verification Problems
-│   │   ├── Password Reset Requests
-│   │   ├── Account Reactivation
-│   │   └── Exceeded Verification Attempts
-│   └── Account Information Updates
-│       ├── Email Address Changes
-│       ├── Mobile Number Verification
-│       └── Corporate Email Signup Issues
-│
-├── Order Management
-│   ├── Order Status & Tracking
-│   │   ├── Delivery Status Inquiries
-│   │   ├── Order Confirmation Checks
-│   │   └── Tracking Information Requests
-│   └── Order Modifications
-│       ├── Address Changes for Pickup/Delivery
-│       ├── Cancellation Requests
-│       └── Expedited Shipping Requests
-│
-├── Product Issues
-│   ├── Defective Products
-│   │   ├── Not Working Properly
-│   │   ├── Damaged Upon Arrival
-│   │   └── Installation Problems
-│   └── Wrong Items Received
-│       ├── Incorrect Product Shipped
-│       └── Size/Model Mismatches
-│
-├── Returns & Exchanges
-│   ├── Return Processes
-│   │   ├── Return Eligibility
-│   │   ├── Return Fees and Policies
-│   │   └── Prepaid Shipping Labels
-│   └── Exchange Requests
-│       ├── Product Replacements
-│       ├── Size Exchanges
-│       └── Defective Item Exchanges
-│
-├── Billing & Payment
-│   ├── Payment Issues
-│   │   ├── Cash on Delivery Problems
-│   │   ├── Credit Card Payment Failures
-│   │   └── Billing Discrepancies
-│   └── Refunds
-│       ├── Refund Status Checks
-│       ├── Refund Processing Times
-│       └── Courier Charge Reimbursements
-│
-├── Warranty & Support
-│   ├── Warranty Information
-│   │   ├── Warranty Start Dates
-│   │   ├── Warranty Terms and Conditions
-│   │   └── Warranty Claim Processes
-│   └── Technical Support
-│       ├── Installation Assistance
-│       ├── Product Troubleshooting
-│       └── Service Center Issues
-│
-├── Delivery & Shipping
-│   ├── Delivery Problems
-│   │   ├── Delayed Deliveries
-│   │   ├── Missing Packages
-│   │   └── Failed Delivery Attempts
-│   └── Shipping Options
-│       ├── Faster Delivery Requests
-│       ├── Shipping Availability by Location
-│       └── Delivery Time Estimates
-│
-├── Inventory & Availability
-│   └── Stock Issues
-│       ├── Out of Stock Products
-│       ├── Availability Inquiries
-│       └── Waitlist Requests
-│
-├── Pricing & Promotions
-│   └── Pricing Discrepancies
-│       ├── Different Prices for Same Products
-│       ├── Hidden Charges
-│       └── Loyalty Points and Rewards
-│
-└── Documentation
-    └── Invoice Issues
-        ├── Missing Invoices
-        ├── Invoice Generation Problems
-        └── Invoice Delivery to Email
-
-Original output:
-"""
\ No newline at end of file
+# The invalid output goes in the user message (see build_repair_user_prompt) so this stays a stable prefix
+repair_prompt = build_system_prompt(instructions, TAXONOMY_INDEX)
@@ -1,6 +1,7 @@
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, Field, field_validator
 
-from app.constants import TAXONOMY_DATA
+from app.constants import BATCH_MAX_ITEMS
+from app.taxonomy.index import TAXONOMY_INDEX
 
 class TaxonomyData(BaseModel):
     primary_to_secondary_data: dict[str, list[str]]
@@ -16,24 +17,48 @@ class TaxonomyOutput(BaseModel):
 
     @field_validator('primary_topic')
     def validate_primary_topic(cls, v):
-        if v not in TAXONOMY_DATA["primary_to_secondary_data"]:
+        if not TAXONOMY_INDEX.is_primary(v):
             raise ValueError(f"Invalid primary topic: {v}")
         return v
     
     @field_validator('secondary_topic')
-    def validate_secondary_topic(cls, v):
-        if v not in TAXONOMY_DATA["secondary_to_tertiary_data"]:
+    def validate_secondary_topic(cls, v, info):
+        if not TAXONOMY_INDEX.is_secondary(v):
             raise ValueError(f"Invalid secondary topic: {v}")
+        primary_topic = info.data.get('primary_topic')
+        if primary_topic and not TAXONOMY_INDEX.is_child(primary_topic, v):
+            raise ValueError(f"Invalid secondary topic: {v} for primary topic: {primary_topic}")
         return v
     
     @field_validator('tertiary_topic')
     def validate_tertiary_topic(cls, v, info):
         secondary_topic = info.data.get('secondary_topic')
         if secondary_topic:
-            valid_tertiaries = TAXONOMY_DATA["secondary_to_tertiary_data"].get(secondary_topic, [])
-            if v not in valid_tertiaries:
+            if not TAXONOMY_INDEX.is_child(secondary_topic, v):
                 raise ValueError(f"Invalid tertiary topic: {v} for secondary topic: {secondary_topic}")
         return v
 
 class QueryRequest(BaseModel):
-    user_query: str
\ No newline at end of file
+    user_query: str
+
+class BatchQueryRequest(BaseModel):
+    queries: list[QueryRequest] = Field(min_length=1, max_length=BATCH_MAX_ITEMS)
+
+class BatchItemResult(BaseModel):
+    index: int
+    result: TaxonomyOutput | None = None
+    usage: dict | None = None
+    error: str | None = None
+
+class KnowledgeBaseRecord(BaseModel):
+    conversation_id: int
+    conversation: str = Field(min_length=1)
+    primary_topic: str | None = None
+    secondary_topic: str | None = None
+    tertiary_topic: str | None = None
+
+class KnowledgeBaseUpsertRequest(BaseModel):
+    records: list[KnowledgeBaseRecord] = Field(min_length=1, max_length=BATCH_MAX_ITEMS)
+
+class KnowledgeBaseDeleteRequest(BaseModel):
+    conversation_ids: list[int] = Field(min_length=1, max_length=BATCH_MAX_ITEMS)
@@ -0,0 +1,62 @@
+import sys
+from types import MappingProxyType
+from typing import Dict, List, Tuple
+
+from app.constants import TAXONOMY_DATA
+
+Path = Tuple[str, str, str]
+
+class TaxonomyIndex:
+    # Immutable lookup structures compiled once from TAXONOMY_DATA. Kept free of pydantic and
+    # the schemas module so the TaxonomyOutput validators can use it without an import cycle.
+    def __init__(self, taxonomy_data: dict):
+        primary_to_secondary = taxonomy_data["primary_to_secondary_data"]
+        secondary_to_tertiary = taxonomy_data["secondary_to_tertiary_data"]
+
+        label_ids: Dict[str, int] = {}
+
+        def intern(label: str) -> str:
+            label = sys.intern(label)
+            label_ids.setdefault(label, len(label_ids))
+            return label
+
+        children: Dict[str, Tuple[str, ...]] = {}
+        secondary_parent: Dict[str, str] = {}
+        tertiary_parents: Dict[str, List[str]] = {}
+        paths: List[Path] = []
+        for primary, secondaries in primary_to_secondary.items():
+            primary = intern(primary)
+            children[primary] = tuple(intern(secondary) for secondary in secondaries)
+            for secondary in children[primary]:
+                secondary_parent[secondary] = primary
+                children[secondary] = tuple(intern(tertiary) for tertiary in secondary_to_tertiary.get(secondary, []))
+                for tertiary in children[secondary]:
+                    tertiary_parents.setdefault(tertiary, []).append(secondary)
+                    paths.append((primary, secondary, tertiary))
+
+        self.primaries: Tuple[str, ...] = tuple(intern(primary) for primary in primary_to_secondary)
+        self.secondaries: Tuple[str, ...] = tuple(secondary_parent)
+        self.tertiaries: Tuple[str, ...] = tuple(tertiary_parents)
+        self.label_ids = MappingProxyType(label_ids)
+        self.children = MappingProxyType(children)
+        self.secondary_parent = MappingProxyType(secondary_parent)
+        # A tertiary label may in principle sit under more than one secondary
+        self.tertiary_parents = MappingProxyType({label: tuple(parents) for label, parents in tertiary_parents.items()})
+        self.paths: Tuple[Path, ...] = tuple(paths)
+        self.valid_paths = frozenset(paths)
+        self._primary_set = frozenset(self.primaries)
+        self._children_sets = MappingProxyType({label: frozenset(labels) for label, labels in children.items()})
+
+    def is_primary(self, label: str) -> bool:
+        return label in self._primary_set
+
+    def is_secondary(self, label: str) -> bool:
+        return label in self.secondary_parent
+
+    def is_child(self, parent: str, label: str) -> bool:
+        return label in self._children_sets.get(parent, ())
+
+    def is_valid_path(self, primary: str, secondary: str, tertiary: str) -> bool:
+        return (primary, secondary, tertiary) in self.valid_paths
+
+TAXONOMY_INDEX = TaxonomyIndex(TAXONOMY_DATA)
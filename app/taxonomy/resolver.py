@@ -0,0 +1,131 @@
+import logging
+import re
+import threading
+from collections import deque
+from difflib import SequenceMatcher
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Tuple
+import numpy as np
+
+from app.constants import LABEL_RESOLVER_MIN_SCORE
+from app.taxonomy.index import TAXONOMY_INDEX, Path, TaxonomyIndex
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+LEVELS = ("primary_topic", "secondary_topic", "tertiary_topic")
+# Deeper labels are more specific, so they carry more evidence about the intended path
+LEVEL_WEIGHTS = (1, 2, 3)
+
+def normalize_label(label: Any) -> str:
+    text = str(label or "").lower().replace("&", " and ")
+    return re.sub(r"[^a-z0-9]+", " ", text).strip()
+
+def _tokens(text: str) -> frozenset:
+    # Light stemming so "Refund Status Check" still matches "Refund Status Checks"
+    return frozenset(token[:-1] if len(token) > 3 and token.endswith("s") else token for token in text.split())
+
+class LabelResolver:
+    # Snaps near-miss labels ("Order Status and Tracking", wrong casing, a tertiary under the
+    # wrong secondary) onto the closest valid path. Each label scores the mean of character
+    # (edit-distance ratio), token (Jaccard) and, when an embedder is given, embedding cosine
+    # similarity; a path scores the specificity-weighted mean over its three labels.
+    def __init__(
+        self,
+        index: TaxonomyIndex = TAXONOMY_INDEX,
+        min_score: float = LABEL_RESOLVER_MIN_SCORE,
+        embed: Callable[[List[str]], List[np.ndarray]] | None = None,
+    ):
+        self.index = index
+        self.min_score = min_score
+        self.embed = embed
+        self._normalized = {label: normalize_label(label) for label in index.label_ids}
+        self._label_tokens = {label: _tokens(text) for label, text in self._normalized.items()}
+        self._label_vectors: Dict[str, np.ndarray] | None = None
+        self._lock = threading.Lock()
+        self.corrections = deque(maxlen=100)
+        self.stats_counters = {"corrections": 0, "unresolved": 0}
+        # Models tend to repeat the same wrong labels, so per-label similarities are memoised
+        self._cached_similarities = lru_cache(maxsize=1024)(self._similarities)
+
+    @property
+    def enabled(self) -> bool:
+        return self.min_score > 0
+
+    def warm_up(self):
+        # Label embeddings are computed once, off the request path when called at startup
+        if self.embed is None or self._label_vectors is not None:
+            return
+        labels = list(self.index.label_ids)
+        vectors = [np.asarray(vector, dtype=np.float32) for vector in self.embed(labels)]
+        self._label_vectors = {
+            label: vector / max(float(np.linalg.norm(vector)), 1e-12) for label, vector in zip(labels, vectors)
+        }
+        self._cached_similarities.cache_clear()
+        logger.info(f"Label resolver embedded {len(labels)} taxonomy labels")
+
+    def _similarities(self, value: str, candidates: Tuple[str, ...]) -> Dict[str, float]:
+        text = normalize_label(value)
+        if not text:
+            return {label: 0.0 for label in candidates}
+        tokens = _tokens(text)
+        query_vector = None
+        if self._label_vectors is not None:
+            query_vector = np.asarray(self.embed([value])[0], dtype=np.float32)
+            query_vector /= max(float(np.linalg.norm(query_vector)), 1e-12)
+
+        similarities = {}
+        for label in candidates:
+            if text == self._normalized[label]:
+                similarities[label] = 1.0
+                continue
+            label_tokens = self._label_tokens[label]
+            scores = [
+                SequenceMatcher(None, text, self._normalized[label]).ratio(),
+                len(tokens & label_tokens) / len(tokens | label_tokens) if tokens | label_tokens else 0.0,
+            ]
+            if query_vector is not None:
+                scores.append(max(float(query_vector @ self._label_vectors[label]), 0.0))
+            similarities[label] = sum(scores) / len(scores)
+        return similarities
+
+    def resolve(self, output: Dict[str, Any]) -> Tuple[Path, float] | None:
+        if not self.enabled or not isinstance(output, dict):
+            return None
+
+        primary = self._cached_similarities(str(output.get("primary_topic") or ""), self.index.primaries)
+        secondary = self._cached_similarities(str(output.get("secondary_topic") or ""), self.index.secondaries)
+        tertiary = self._cached_similarities(str(output.get("tertiary_topic") or ""), self.index.tertiaries)
+
+        best_path, best_score = None, 0.0
+        for path in self.index.paths:
+            similarities = [primary[path[0]], secondary[path[1]], tertiary[path[2]]]
+            # An exact label that sits under a single parent pins its ancestors, so a near-miss
+            # path is scored from its deepest exact label rather than averaged against it
+            if similarities[2] == 1.0 and len(self.index.tertiary_parents[path[2]]) == 1:
+                similarities[:2] = [1.0, 1.0]
+            elif similarities[1] == 1.0:
+                similarities[0] = 1.0
+            score = sum(weight * similarity for weight, similarity in zip(LEVEL_WEIGHTS, similarities)) / sum(LEVEL_WEIGHTS)
+            if score > best_score:
+                best_path, best_score = path, score
+
+        original = tuple(output.get(level) for level in LEVELS)
+        if best_path is None or best_score < self.min_score:
+            self._record(None, original, best_path, best_score)
+            logger.info(f"Label resolver could not place {original} (best {best_path}, score {best_score:.3f})")
+            return None
+
+        self._record("corrections", original, best_path, best_score)
+        logger.info(f"Label resolver corrected {original} -> {best_path} (score {best_score:.3f})")
+        return best_path, best_score
+
+    def _record(self, counter: str | None, original, resolved, score: float):
+        with self._lock:
+            self.stats_counters[counter or "unresolved"] += 1
+            if counter:
+                self.corrections.append({"from": list(original), "to": list(resolved), "score": round(score, 4)})
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"enabled": self.enabled, **self.stats_counters, "recent": list(self.corrections)[-10:]}
@@ -1,6 +1,8 @@
-from typing import List
+from typing import List, Tuple
 
+from app.constants import TAXONOMY_DATA
 from app.schemas.taxonomy_data import TaxonomyData, TaxonomyOutput
+from app.taxonomy.index import TAXONOMY_INDEX, TaxonomyIndex
 
 class Node:
     def __init__(self, value: str, children: List | None = None):
@@ -8,49 +10,42 @@ class Node:
         self.children = children or []
 
 class TaxonomyTree:
-    def __init__(self, taxonomy_data: dict | TaxonomyData | None):
+    def __init__(self, taxonomy_data: dict | TaxonomyData | TaxonomyIndex | None):
         self.root = Node("Customer Support Topics")
+        self.index = None
         if taxonomy_data:
+            if taxonomy_data is TAXONOMY_DATA:
+                taxonomy_data = TAXONOMY_INDEX
             if isinstance(taxonomy_data, dict):
                 taxonomy_data = TaxonomyData(**taxonomy_data)
+            if isinstance(taxonomy_data, TaxonomyData):
+                taxonomy_data = TaxonomyIndex(taxonomy_data.model_dump())
+            self.index = taxonomy_data
             self._build_tree(taxonomy_data)
 
-    def _build_tree(self, data: TaxonomyData, parent=None):
+    def _build_tree(self, index: TaxonomyIndex, parent=None):
         if parent is None:
             parent = self.root
         
-        for primary, secondaries in data.primary_to_secondary_data.items():
+        for primary in index.primaries:
             primary_node = Node(primary)
             parent.children.append(primary_node)
 
-            for secondary in secondaries:
+            for secondary in index.children[primary]:
                 secondary_node = Node(secondary)
                 primary_node.children.append(secondary_node)
 
-                tertiary = data.secondary_to_tertiary_data.get(secondary, [])
-                for tertiary_item in tertiary:
+                for tertiary_item in index.children[secondary]:
                     tertiary_node = Node(tertiary_item)
                     secondary_node.children.append(tertiary_node)
 
+    def paths(self) -> List[Tuple[str, str, str]]:
+        return list(self.index.paths) if self.index else []
+
     def validate_path(self, llm_output: TaxonomyOutput) -> bool:
-        primary_node = next((node for node in self.root.children if node.value == llm_output.primary_topic), None)
-        if not primary_node:
-            # raise ValueError(f"Primary topic '{llm_output.primary_topic}' not found in the tree.")
-            return False
-        secondary_node = next((node for node in primary_node.children if node.value == llm_output.secondary_topic), None)
-        if not secondary_node:
-            # raise ValueError(f"Secondary topic '{llm_output.secondary_topic}' not found under primary topic '{llm_output.primary_topic}'.")
+        if self.index is None:
             return False
-        tertiary_node = next((node for node in secondary_node.children if node.value == llm_output.tertiary_topic), None)
-        if not tertiary_node:
-            # raise ValueError(f"Tertiary topic '{llm_output.tertiary_topic}' not found under secondary topic '{llm_output.secondary_topic}'.")
-            return False
-        return True
-        
-
-        
-
-    
-    
+        return self.index.is_valid_path(llm_output.primary_topic, llm_output.secondary_topic, llm_output.tertiary_topic)
 
-    
\ No newline at end of file
+# Built once from the shared index; per-request code should use this rather than a new tree
+TAXONOMY_TREE = TaxonomyTree(TAXONOMY_INDEX)
@@ -1,12 +1,20 @@
+import argparse
+import asyncio
 import csv
 import logging
+import random
+import sqlite3
 import time
 import hashlib
 import json
 import os
-from typing import Dict
 
-from app.llm.llm_inference import infer
+from app.constants import CONTEXT_TOP_K, LIKELIHOOD_TEMPERATURE
+from app.llm.context_assembler import assemble_context
+from app.llm.fast_path import gold_label
+from app.llm.knowledge_base import get_retriever
+from app.llm.likelihood import fit_temperature, temperature_nll
+from app.llm.llm_inference import ainfer, build_full_prompt, label_resolver
 from app.prompts.system_prompt import system_prompt
 
 logging.basicConfig(level=logging.INFO)
@@ -14,42 +22,141 @@ logger = logging.getLogger(__name__)
 
 INPUT_FILE = "app/data/evals_conversations.csv"
 OUTPUT_FILE = "app/data/evaluation_results.csv"
-CACHE_FILE = "app/data/eval_cache.json"
+CACHE_FILE = "app/data/eval_cache.sqlite3"
+# Whole-file JSON cache used by earlier runs; imported into SQLite on first use
+LEGACY_CACHE_FILE = "app/data/eval_cache.json"
 
 START_FROM = 1
 END_AT = 1000
 
-REQUESTS_PER_MINUTE = 20
-SLEEP_SECONDS = 60 / REQUESTS_PER_MINUTE
+# Upper bound on conversations in flight; each provider's adaptive concurrency limiter
+# (shared with the API) decides how many of them actually reach it at once
+CONCURRENCY = 32
 MAX_RETRIES = 3
+BACKOFF_BASE_SECONDS = 2
+BACKOFF_MAX_SECONDS = 60
 
 
 def hash_text(text: str) -> str:
     return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
 
-def load_cache() -> Dict[str, dict]:
-    if os.path.exists(CACHE_FILE):
-        with open(CACHE_FILE, "r") as f:
-            return json.load(f)
-    return {}
-
-
-def save_cache(cache: Dict[str, dict]):
-    with open(CACHE_FILE, "w") as f:
-        json.dump(cache, f, indent=2)
-
-
-def evaluate_conversations():
+class EvalCache:
+    # SQLite in WAL mode: O(1) indexed inserts and lookups, and an interrupted
+    # write can no longer corrupt previously cached labels
+    def __init__(self, path: str = CACHE_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS eval_cache ("
+            "conversation_hash TEXT PRIMARY KEY, "
+            "record TEXT NOT NULL, "
+            "updated_at REAL NOT NULL)"
+        )
+        self._import_legacy_cache()
+
+    def _import_legacy_cache(self):
+        if len(self) or not os.path.exists(LEGACY_CACHE_FILE):
+            return
+
+        with open(LEGACY_CACHE_FILE, "r") as f:
+            legacy = json.load(f)
+
+        logger.info(f"Importing {len(legacy)} entries from {LEGACY_CACHE_FILE}")
+        now = time.time()
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO eval_cache (conversation_hash, record, updated_at) VALUES (?, ?, ?)",
+                [(conv_hash, json.dumps(record), now) for conv_hash, record in legacy.items()],
+            )
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM eval_cache").fetchone()[0]
+
+    def get(self, conv_hash: str) -> dict | None:
+        row = self.conn.execute(
+            "SELECT record FROM eval_cache WHERE conversation_hash = ?", (conv_hash,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, conv_hash: str, record: dict):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO eval_cache (conversation_hash, record, updated_at) VALUES (?, ?, ?)",
+            (conv_hash, json.dumps(record), time.time()),
+        )
+
+    def compact(self):
+        logger.info(f"Compacting {self.path}")
+        self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.conn.execute("VACUUM")
+        logger.info(f"Compacted cache with {len(self)} entries")
+
+    def close(self):
+        self.conn.close()
+
+
+def backoff_delay(attempt: int) -> float:
+    # Exponential backoff with full jitter so retries from parallel workers spread out
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+async def classify_row(row: dict, retriever) -> dict | None:
+    conversation = row["conversation"]
+    conv_id = row["conversation_id"]
+
+    for attempt in range(MAX_RETRIES):
+        try:
+            start_time = time.time()
+            result, usage = await ainfer(system_prompt, conversation, retriever)
+            latency = int((time.time() - start_time) * 1000)
+
+            logger.info(
+                f"✓ {result.primary_topic} → {result.secondary_topic} → "
+                f"{result.tertiary_topic} ({latency}ms)"
+            )
+
+            return {
+                "conversation_id": conv_id,
+                "predicted_primary": result.primary_topic,
+                "predicted_secondary": result.secondary_topic,
+                "predicted_tertiary": result.tertiary_topic,
+                "confidence": result.confidence,
+                "latency_ms": latency,
+                "input_tokens": usage.get("prompt_tokens", 0),
+                "output_tokens": usage.get("completion_tokens", 0),
+            }
+
+        except Exception as e:
+            if attempt == MAX_RETRIES - 1:
+                logger.warning(f"[RETRY {attempt + 1}/{MAX_RETRIES}] Conversation {conv_id} failed: {e}")
+                break
+            delay = backoff_delay(attempt)
+            logger.warning(
+                f"[RETRY {attempt + 1}/{MAX_RETRIES}] Conversation {conv_id} failed: {e} "
+                f"(retrying in {delay:.1f}s)"
+            )
+            await asyncio.sleep(delay)
+
+    return None
+
+
+async def evaluate_conversations():
     logger.info("Starting evaluation job")
 
-    cache = load_cache()
+    cache = EvalCache()
     logger.info(f"Loaded cache with {len(cache)} entries")
 
     with open(INPUT_FILE, "r") as infile:
         reader = csv.DictReader(infile)
         rows = list(reader)
 
+    retriever = get_retriever()
+    # Same label resolver as the API, so LABEL_RESOLVER_MIN_SCORE can be tuned on these results
+    label_resolver.warm_up()
+
     file_exists = os.path.exists(OUTPUT_FILE)
 
     with open(OUTPUT_FILE, "a", newline="") as outfile:
@@ -70,81 +177,105 @@ def evaluate_conversations():
         if not file_exists:
             writer.writeheader()
 
-        for i, row in enumerate(rows[START_FROM - 1 : END_AT], start=START_FROM):
-            conversation = row["conversation"]
-            conv_id = row["conversation_id"]
-            conv_hash = hash_text(conversation)
+        queue: asyncio.Queue = asyncio.Queue()
 
-            if conv_hash in cache:
-                logger.info(f"[SKIP] Conversation {conv_id} already labeled")
-                cached = cache[conv_hash]
+        for row in rows[START_FROM - 1 : END_AT]:
+            conv_hash = hash_text(row["conversation"])
+            cached = cache.get(conv_hash)
 
+            if cached is not None:
+                logger.info(f"[SKIP] Conversation {row['conversation_id']} already labeled")
                 writer.writerow({
-                    "conversation_id": conv_id,
+                    "conversation_id": row["conversation_id"],
                     "conversation_hash": conv_hash,
                     **cached
                 })
                 continue
 
-            logger.info(f"[PROCESS] Conversation {conv_id}")
+            queue.put_nowait((row, conv_hash))
+
+        logger.info(f"{queue.qsize()} conversations to label with {CONCURRENCY} workers")
 
-            retries = 0
-            while retries < MAX_RETRIES:
+        async def worker():
+            while True:
                 try:
-                    start_time = time.time()
-                    result, usage = infer(system_prompt, conversation)
-                    latency = int((time.time() - start_time) * 1000)
+                    row, conv_hash = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
 
-                    record = {
-                        "conversation_id": conv_id,
-                        "predicted_primary": result.primary_topic,
-                        "predicted_secondary": result.secondary_topic,
-                        "predicted_tertiary": result.tertiary_topic,
-                        "confidence": result.confidence,
-                        "latency_ms": latency,
-                        "input_tokens": usage.get("prompt_tokens", 0),
-                        "output_tokens": usage.get("completion_tokens", 0),
-                    }
-
-                    cache[conv_hash] = record
-                    save_cache(cache)
+                conv_id = row["conversation_id"]
+                logger.info(f"[PROCESS] Conversation {conv_id}")
+                record = await classify_row(row, retriever)
 
+                if record is None:
+                    logger.error(f"[FAILED] Conversation {conv_id} permanently failed")
                     writer.writerow({
                         "conversation_id": conv_id,
                         "conversation_hash": conv_hash,
-                        **record
+                        "predicted_primary": "ERROR",
+                        "predicted_secondary": "ERROR",
+                        "predicted_tertiary": "ERROR",
+                        "confidence": 0.0,
+                        "latency_ms": 0,
+                        "input_tokens": 0,
+                        "output_tokens": 0,
                     })
+                    continue
 
-                    logger.info(
-                        f"✓ {result.primary_topic} → {result.secondary_topic} → "
-                        f"{result.tertiary_topic} ({latency}ms)"
-                    )
-
-                    time.sleep(SLEEP_SECONDS)
-                    break
-
-                except Exception as e:
-                    retries += 1
-                    logger.warning(
-                        f"[RETRY {retries}/{MAX_RETRIES}] Conversation {conv_id} failed: {e}"
-                    )
-                    time.sleep(30)
-
-            else:
-                logger.error(f"[FAILED] Conversation {conv_id} permanently failed")
+                # Caching each result as it lands lets an interrupted run resume where it stopped
+                cache.put(conv_hash, record)
 
                 writer.writerow({
                     "conversation_id": conv_id,
                     "conversation_hash": conv_hash,
-                    "predicted_primary": "ERROR",
-                    "predicted_secondary": "ERROR",
-                    "predicted_tertiary": "ERROR",
-                    "confidence": 0.0,
-                    "latency_ms": 0,
-                    "input_tokens": 0,
-                    "output_tokens": 0,
+                    **record
                 })
+                outfile.flush()
+
+        await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+
+    cache.close()
+
+
+def fit_likelihood_temperature():
+    # The evaluation set carries no gold labels, so the temperature is fitted leave-one-out on
+    # the labelled KB: each row is scored with its neighbours (never itself) as context
+    from app.llm.providers.llama_cpp_provider import LlamaCppProvider
+
+    provider = LlamaCppProvider()
+    retriever = get_retriever()
+    samples = []
+    for conv in retriever.conversations.values():
+        gold = gold_label(conv)
+        if gold is None:
+            continue
+        hits = retriever.vector_db.search_vectors(query_vector=conv["embedding"], top_k=CONTEXT_TOP_K + 1)
+        context = assemble_context([hit for hit in hits if hit.id != conv["id"]][:CONTEXT_TOP_K])
+        samples.append((provider.path_log_likelihoods(system_prompt, build_full_prompt(conv["text"], context)), gold))
+        logger.info(f"[SCORED] KB row {conv['id']} ({len(samples)} samples)")
+
+    if not samples:
+        logger.error("No labelled KB rows to fit the temperature on")
+        return
+
+    temperature = fit_temperature(samples)
+    logger.info(
+        f"NLL over {len(samples)} held-out KB rows: {temperature_nll(samples, LIKELIHOOD_TEMPERATURE):.4f} "
+        f"at the current temperature {LIKELIHOOD_TEMPERATURE}, {temperature_nll(samples, temperature):.4f} at {temperature:.4f}"
+    )
+    print(f"LIKELIHOOD_TEMPERATURE={temperature:.4f}")
 
 
 if __name__ == "__main__":
-    evaluate_conversations()
+    parser = argparse.ArgumentParser(description="Evaluate the classifier on labelled conversations")
+    parser.add_argument("command", nargs="?", choices=["run", "compact", "fit-temperature"], default="run")
+    args = parser.parse_args()
+
+    if args.command == "compact":
+        cache = EvalCache()
+        cache.compact()
+        cache.close()
+    elif args.command == "fit-temperature":
+        fit_likelihood_temperature()
+    else:
+        asyncio.run(evaluate_conversations())
@@ -0,0 +1,128 @@
+import ctypes
+import json
+import os
+
+import numpy as np
+import pytest
+
+from app.llm.likelihood import PathScorer, _log_softmax
+
+PATHS = [
+    ("Billing & Payment", "Refunds", "Refund Status Checks"),
+    ("Billing & Payment", "Refunds", "Refund Requests"),
+    ("Billing & Payment", "Payment Issues", "Failed Payments"),
+    ("Account Management", "Login Issues", "Password Reset"),
+]
+
+# Longer than the n_batch used below, so the prompt is decoded over several batches
+PROMPT = "Customer: my refund still hasn't arrived, where is it? " * 12 + "\nAssistant: {"
+
+class FakeContext:
+    def __init__(self, n_vocab: int):
+        self.logits = np.zeros(n_vocab, dtype=np.float32)
+
+    def get_logits_ith(self, i: int):
+        return self.logits.ctypes.data_as(ctypes.POINTER(ctypes.c_float))
+
+class FakeLlama:
+    # Mirrors Llama.eval with logits_all=False: tokens past n_tokens are dropped from the KV
+    # cache, input is decoded in n_batch chunks, only the last token of a decode gets logits,
+    # and model.scores is never written (it only has n_batch rows)
+    def __init__(self, n_vocab: int = 256, n_ctx: int = 2048, n_batch: int = 64):
+        self._n_vocab = n_vocab
+        self._n_ctx = n_ctx
+        self.n_batch = n_batch
+        self.n_tokens = 0
+        self.input_ids = np.zeros(n_ctx, dtype=np.intc)
+        self.scores = np.zeros((n_batch, n_vocab), dtype=np.single)
+        self._ctx = FakeContext(n_vocab)
+
+    def n_ctx(self) -> int:
+        return self._n_ctx
+
+    def n_vocab(self) -> int:
+        return self._n_vocab
+
+    def tokenize(self, text: bytes, add_bos: bool = True, special: bool = False):
+        return ([1] if add_bos else []) + list(text)
+
+    def logits_for(self, prefix) -> np.ndarray:
+        rng = np.random.default_rng(abs(hash(tuple(int(token) for token in prefix))))
+        return (rng.standard_normal(self._n_vocab) * 3).astype(np.float32)
+
+    def eval(self, tokens):
+        for i in range(0, len(tokens), self.n_batch):
+            batch = tokens[i : i + self.n_batch]
+            self.input_ids[self.n_tokens : self.n_tokens + len(batch)] = batch
+            self.n_tokens += len(batch)
+            self._ctx.logits[:] = self.logits_for(self.input_ids[: self.n_tokens])
+
+def continuation(model, path):
+    # (token, scored) pairs of the JSON continuation, built independently of the scorer's trie
+    pieces = []
+    for key, label in zip(("primary_topic", "secondary_topic", "tertiary_topic"), path):
+        scaffold = f'"{key}":"' if key == "primary_topic" else f',"{key}":"'
+        pieces.append((scaffold, False))
+        pieces.append((json.dumps(label, ensure_ascii=False)[1:], True))
+    return [
+        (token, scored)
+        for text, scored in pieces
+        for token in model.tokenize(text.encode("utf-8"), add_bos=False, special=False)
+    ]
+
+def reference_log_likelihood(prompt_tokens, pairs, next_logprobs) -> float:
+    tokens = list(prompt_tokens)
+    total = 0.0
+    for token, scored in pairs:
+        if scored:
+            total += next_logprobs(tokens)[token]
+        tokens.append(token)
+    return total
+
+def test_scorer_matches_full_sequence_likelihoods():
+    model = FakeLlama()
+    scorer = PathScorer(model, PATHS)
+    log_likelihoods, n_tokens, _ = scorer.log_likelihoods(PROMPT)
+    assert n_tokens > model.n_batch
+
+    prompt_tokens = model.tokenize(PROMPT.encode("utf-8"))
+    next_logprobs = lambda tokens: _log_softmax(model.logits_for(tokens).astype(np.float64))
+    for path in PATHS:
+        expected = reference_log_likelihood(prompt_tokens, continuation(model, path), next_logprobs)
+        assert log_likelihoods[path] == pytest.approx(expected, abs=1e-6)
+
+def test_scorer_reuses_cached_prompt_prefix():
+    model = FakeLlama()
+    scorer = PathScorer(model, PATHS)
+    first, _, _ = scorer.log_likelihoods(PROMPT)
+    second, _, cached = scorer.log_likelihoods(PROMPT)
+    assert cached > 0
+    for path in PATHS:
+        assert second[path] == pytest.approx(first[path], abs=1e-6)
+
+def test_scorer_matches_llama_cpp_logits_all():
+    # Runs against a real GGUF when one is provided, e.g. LLAMA_TEST_MODEL_PATH=models/qwen.gguf
+    llama_cpp = pytest.importorskip("llama_cpp")
+    model_path = os.getenv("LLAMA_TEST_MODEL_PATH")
+    if not model_path or not os.path.exists(model_path):
+        pytest.skip("LLAMA_TEST_MODEL_PATH not set")
+
+    options = dict(model_path=model_path, n_ctx=2048, n_batch=64, verbose=False)
+    model = llama_cpp.Llama(**options)
+    reference = llama_cpp.Llama(logits_all=True, **options)
+
+    scorer = PathScorer(model, PATHS)
+    log_likelihoods, n_tokens, _ = scorer.log_likelihoods(PROMPT)
+    assert n_tokens > model.n_batch
+
+    prompt_tokens = model.tokenize(PROMPT.encode("utf-8"), add_bos=True, special=False)
+    for path in PATHS:
+        pairs = continuation(model, path)
+        reference.reset()
+        reference.eval(prompt_tokens + [token for token, _ in pairs])
+
+        def next_logprobs(tokens):
+            return _log_softmax(reference.scores[len(tokens) - 1].astype(np.float64))
+
+        expected = reference_log_likelihood(prompt_tokens, pairs, next_logprobs)
+        assert log_likelihoods[path] == pytest.approx(expected, abs=0.05)
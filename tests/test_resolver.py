@@ -0,0 +1,31 @@
+from app.taxonomy.resolver import LabelResolver
+
+def test_exact_tertiary_under_wrong_secondary_snaps_to_its_parents():
+    resolver = LabelResolver(min_score=0.8)
+    resolved = resolver.resolve({
+        "primary_topic": "Billing & Payment",
+        "secondary_topic": "Payment Issues",
+        "tertiary_topic": "Refund Status Checks",
+    })
+    assert resolved is not None
+    path, score = resolved
+    assert path == ("Billing & Payment", "Refunds", "Refund Status Checks")
+    assert score >= 0.8
+
+def test_exact_secondary_under_wrong_primary_snaps():
+    resolver = LabelResolver(min_score=0.8)
+    resolved = resolver.resolve({
+        "primary_topic": "Account Management",
+        "secondary_topic": "Refunds",
+        "tertiary_topic": "Refund Status Check",
+    })
+    assert resolved is not None
+    assert resolved[0] == ("Billing & Payment", "Refunds", "Refund Status Checks")
+
+def test_unrelated_labels_stay_unresolved():
+    resolver = LabelResolver(min_score=0.8)
+    assert resolver.resolve({
+        "primary_topic": "Weather",
+        "secondary_topic": "Forecasts",
+        "tertiary_topic": "Rain",
+    }) is None